@@ -35,6 +35,19 @@ class UserAdmin(admin.ModelAdmin):
 
     search_fields = ["username", "email"]
 
+    # Fields read from the Keycloak profile of `KeycloakUser`
+    profile_fields = {"email", "first_name", "last_name", "full_name"}
+
+    def get_queryset(self, request):
+        """
+        Loads the Keycloak profiles of a page of users at once, when the
+        change list displays them.
+        """
+        queryset = super().get_queryset(request)
+        if self.profile_fields.intersection(self.get_list_display(request)):
+            queryset = queryset.prefetch_keycloak_profiles()
+        return queryset
+
     def keycloak_link(self, obj):
         """
         Adds an hyperlink to django-admin, which open the Keycloak's user profiles on Keycloak's Admin Console.
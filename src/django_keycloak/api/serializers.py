@@ -1,7 +1,9 @@
 from django.contrib.auth import get_user_model
+from django.db.models.manager import BaseManager
 from rest_framework import serializers
 from rest_framework.exceptions import AuthenticationFailed, ValidationError
 from django_keycloak import Token
+from django_keycloak.managers import prefetch_keycloak_profiles
 
 
 class GetTokenSerializer(serializers.Serializer):
@@ -39,6 +41,17 @@ class RefreshTokenSerializer(serializers.Serializer):
         }
 
 
+class KeycloakUserListSerializer(serializers.ListSerializer):
+    """
+    List serializer loading the Keycloak profiles of all the users at once
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, BaseManager) else data)
+        prefetch_keycloak_profiles(users)
+        return super().to_representation(users)
+
+
 class KeycloakUserAutoIdSerializer(serializers.ModelSerializer):
     """
     Serializer for the user endpoint
@@ -46,6 +59,7 @@ class KeycloakUserAutoIdSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = get_user_model()
+        list_serializer_class = KeycloakUserListSerializer
         fields = (
             "id",
             "username",
@@ -1,6 +1,25 @@
 from django.apps import AppConfig
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
 
 
 class DjangoKeycloakConfig(AppConfig):
     name = "django_keycloak"
     verbose_name = "keycloak"
+
+    def ready(self):
+        from django_keycloak.config import settings
+        from django_keycloak.instrumentation import enable_prometheus
+        from django_keycloak.resolver import invalidate_user
+
+        # Keep the cached users in sync with the database
+        User = get_user_model()
+        post_save.connect(
+            invalidate_user, sender=User, dispatch_uid="django_keycloak_user_saved"
+        )
+        post_delete.connect(
+            invalidate_user, sender=User, dispatch_uid="django_keycloak_user_deleted"
+        )
+
+        if settings.PROMETHEUS_METRICS:
+            enable_prometheus()
@@ -0,0 +1,192 @@
+"""
+Module to interact with the Keycloak OpenID API without blocking the event loop.
+
+Uses the optional `httpx` dependency (`pip install httpx`) when installed, and
+otherwise sends the requests with the shared `requests` session, in a thread.
+"""
+import asyncio
+import weakref
+from typing import Optional, Tuple
+from urllib.parse import urljoin
+
+import requests
+from asgiref.sync import sync_to_async
+from keycloak.exceptions import (
+    KeycloakConnectionError,
+    KeycloakGetError,
+    KeycloakPostError,
+    raise_error_from_response,
+)
+from keycloak.urls_patterns import (
+    URL_INTROSPECT,
+    URL_TOKEN,
+    URL_USERINFO,
+)
+
+from django_keycloak.connection import http_session
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+
+class AsyncKeycloakOpenID:
+    """
+    Asynchronous counterpart of `KeycloakOpenID`, implementing the
+    subset of the OpenID API used to validate and refresh tokens.
+
+    Each event loop gets its own `httpx.AsyncClient`, so that pooled
+    connections are never shared between loops. Without `httpx`, requests
+    are sent with the shared `requests` session, in a thread.
+    """
+
+    def __init__(
+        self,
+        server_url: str,
+        realm_name: str,
+        client_id: str,
+        client_secret_key: Optional[str] = None,
+        timeout: Tuple[float, float] = (10, 60),
+        max_connections: int = 10,
+        keepalive_expiry: float = 5,
+    ):
+        self.server_url = server_url
+        self.realm_name = realm_name
+        self.client_id = client_id
+        self.client_secret_key = client_secret_key
+        # The (connect, read) timeouts
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self._clients: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self) -> "httpx.AsyncClient":
+        """
+        Returns the HTTP client of the running event loop.
+
+        Raises:
+            ImportError: If `httpx` is not installed
+        """
+        if httpx is None:
+            raise ImportError(
+                "The async Keycloak API requires 'httpx'. "
+                "Install it with 'pip install httpx'."
+            )
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            connect_timeout, read_timeout = self.timeout
+            client = self._clients[loop] = httpx.AsyncClient(
+                base_url=self.server_url,
+                timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+            )
+        return client
+
+    def _url(self, pattern: str) -> str:
+        return pattern.format(**{"realm-name": self.realm_name})
+
+    def _add_secret_key(self, payload: dict) -> dict:
+        if self.client_secret_key:
+            payload["client_secret"] = self.client_secret_key
+        return payload
+
+    async def _request(self, method: str, url: str, **kwargs):
+        """
+        Sends a request to Keycloak, through the shared `requests` session
+        in a thread when `httpx` is not installed.
+
+        Raises:
+            KeycloakConnectionError: If Keycloak can't be reached
+        """
+        if httpx is None:
+            return await sync_to_async(self._sync_request, thread_sensitive=False)(
+                method, url, **kwargs
+            )
+        try:
+            return await self.client.request(method, url, **kwargs)
+        except httpx.HTTPError as err:
+            raise KeycloakConnectionError("Can't connect to server (%s)" % err)
+
+    def _sync_request(self, method: str, url: str, **kwargs):
+        """
+        Sends a request to Keycloak with the shared `requests` session.
+
+        Raises:
+            KeycloakConnectionError: If Keycloak can't be reached
+        """
+        try:
+            return http_session.request(
+                method, urljoin(self.server_url, url), timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as err:
+            raise KeycloakConnectionError("Can't connect to server (%s)" % err)
+
+    async def token(self, username: str, password: str, scope: str = "openid") -> dict:
+        """
+        Obtains a token with the password grant.
+
+        Raises:
+            KeycloakError: On invalid credentials or Keycloak API errors
+        """
+        payload = {
+            "username": username,
+            "password": password,
+            "client_id": self.client_id,
+            "grant_type": "password",
+            "scope": scope,
+        }
+        response = await self._request(
+            "POST", self._url(URL_TOKEN), data=self._add_secret_key(payload)
+        )
+        return raise_error_from_response(response, KeycloakPostError)
+
+    async def refresh_token(self, refresh_token: str) -> dict:
+        """
+        Obtains a new token from a refresh token.
+
+        Raises:
+            KeycloakError: On invalid tokens or Keycloak API errors
+        """
+        payload = {
+            "client_id": self.client_id,
+            "grant_type": "refresh_token",
+            "refresh_token": refresh_token,
+        }
+        response = await self._request(
+            "POST", self._url(URL_TOKEN), data=self._add_secret_key(payload)
+        )
+        return raise_error_from_response(response, KeycloakPostError)
+
+    async def introspect(self, token: str) -> dict:
+        """
+        Introspects a token.
+
+        Raises:
+            KeycloakError: On Keycloak API errors
+        """
+        payload = {"client_id": self.client_id, "token": token}
+        response = await self._request(
+            "POST", self._url(URL_INTROSPECT), data=self._add_secret_key(payload)
+        )
+        return raise_error_from_response(response, KeycloakPostError)
+
+    async def userinfo(self, token: str) -> dict:
+        """
+        Gets the user info of the token owner.
+
+        Raises:
+            KeycloakError: On invalid tokens or Keycloak API errors
+        """
+        response = await self._request(
+            "GET",
+            self._url(URL_USERINFO),
+            headers={"Authorization": f"Bearer {token}"},
+        )
+        return raise_error_from_response(response, KeycloakGetError)
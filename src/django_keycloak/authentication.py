@@ -1,12 +1,12 @@
 """
 Custom authentication class for Django Rest Framework.
 """
-from typing import Union
-from django.contrib.auth import get_user_model
-from rest_framework.authentication import TokenAuthentication
+from typing import Optional, Tuple, Union
+from rest_framework.authentication import TokenAuthentication, get_authorization_header
 from rest_framework.exceptions import AuthenticationFailed
 from django_keycloak import Token
 from django_keycloak.config import settings
+from django_keycloak.resolver import user_resolver
 
 
 class KeycloakAuthentication(TokenAuthentication):
@@ -18,6 +18,59 @@ class KeycloakAuthentication(TokenAuthentication):
     # Authentication header. Use the user-defined prefix
     keyword = settings.TOKEN_PREFIX
 
+    def authenticate(self, request):
+        """
+        Reuses the token and user validated by `KeycloakMiddleware` for
+        the same request, if any, instead of validating the token again.
+        """
+        shared = self.get_middleware_authentication(request)
+        if shared is not None:
+            return shared
+        return super().authenticate(request)
+
+    def get_middleware_authentication(self, request) -> Optional[Tuple]:
+        """
+        Returns the (user, access token) pair validated by `KeycloakMiddleware`
+        for the token in the request header, or `None`.
+        """
+        django_request = getattr(request, "_request", request)
+        lazy = getattr(django_request, "keycloak_authentication", None)
+        if lazy is not None:
+            _, user = lazy.resolve()
+            return self._shared_result(request, lazy.token, user)
+        token = getattr(django_request, "keycloak_token", None)
+        return self._shared_result(
+            request, token, getattr(django_request, "user", None)
+        )
+
+    async def aget_middleware_authentication(self, request) -> Optional[Tuple]:
+        """
+        Asynchronous counterpart of `get_middleware_authentication`.
+        """
+        django_request = getattr(request, "_request", request)
+        lazy = getattr(django_request, "keycloak_authentication", None)
+        if lazy is not None:
+            _, user = await lazy.aresolve()
+            return self._shared_result(request, lazy.token, user)
+        token = getattr(django_request, "keycloak_token", None)
+        return self._shared_result(
+            request, token, getattr(django_request, "user", None)
+        )
+
+    def _shared_result(self, request, token: Optional[Token], user) -> Optional[Tuple]:
+        """
+        Returns the (user, access token) pair if `token` is the one
+        in the request header.
+        """
+        if token is None or user is None:
+            return None
+        auth = get_authorization_header(request).split()
+        if len(auth) != 2 or auth[0].lower() != self.keyword.lower().encode():
+            return None
+        if auth[1].decode(errors="replace") != token.access_token:
+            return None
+        return (user, token.access_token)
+
     def authenticate_credentials(self, access_token: str):
         """
         Overrides `authenticate_credentials` to provide custom
@@ -30,8 +83,43 @@ class KeycloakAuthentication(TokenAuthentication):
         if not token:
             raise AuthenticationFailed
 
-        # Get the associated user by keycloak id
-        user = get_user_model().objects.get_by_keycloak_id(token.user_id)
+        # Get the associated user by keycloak id (cached)
+        user = user_resolver.get(token.user_id)
 
         # Return the user and the associated access token
         return (user, token.access_token)
+
+    async def aauthenticate_credentials(self, access_token: str):
+        """
+        Asynchronous counterpart of `authenticate_credentials`.
+        """
+        token: Union[Token, None] = await Token.afrom_access_token(access_token)
+
+        if not token:
+            raise AuthenticationFailed
+
+        claims = await token.aclaims()
+        user = await user_resolver.aget(claims.subject)
+
+        return (user, token.access_token)
+
+
+class AsyncKeycloakAuthentication(KeycloakAuthentication):
+    """
+    Asynchronous variant of `KeycloakAuthentication`, for async DRF views
+    (e.g. using `adrf`) which await coroutine `authenticate` methods.
+    """
+
+    async def authenticate(self, request):
+        shared = await self.aget_middleware_authentication(request)
+        if shared is not None:
+            return shared
+        # `TokenAuthentication.authenticate` parses the authorization header
+        # and returns the (awaitable) result of `authenticate_credentials`
+        result = TokenAuthentication.authenticate(self, request)
+        if result is None:
+            return None
+        return await result
+
+    def authenticate_credentials(self, access_token: str):
+        return self.aauthenticate_credentials(access_token)
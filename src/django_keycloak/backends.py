@@ -47,24 +47,19 @@ class KeycloakAuthenticationBackend(BaseBackend):
         # try to get user from database
         try:
             user = User.objects.get(username=username)
-            if isinstance(user, KeycloakUserAutoId):
-                # Get user information from token
-                user_info = token.user_info
 
-                # Update local user information based on Keycloak
-                # information from token
-                user.first_name = user_info.get("given_name")
-                user.last_name = user_info.get("family_name")
-                user.email = user_info.get("email")
+            # Update local user information based on Keycloak
+            # information from token, only writing the fields that changed
+            is_superuser = bool(token.is_superuser)
+            User.objects.update_from_claims(
+                user, token.claims, is_staff=is_superuser, is_superuser=is_superuser
+            )
 
         except User.DoesNotExist:
-            # If user does not exist create in database
-            # `create_from_token` takes cares of password hashing
-            user = User.objects.create_from_token(token)
+            # If user does not exist create in database, without failing
+            # when a concurrent request creates it first
+            user = User.objects.get_or_create_from_token(token)
 
-        user.is_staff = user.is_superuser = bool(token.is_superuser)
-
-        user.save()
         return user
 
     def get_user(self, user_id: str):
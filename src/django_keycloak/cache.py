@@ -0,0 +1,228 @@
+"""
+Module containing the caches used to avoid repeated Keycloak round trips.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Optional
+
+from asgiref.sync import sync_to_async
+from cachetools import TLRUCache
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# PBKDF2 iterations of the credential digests
+CREDENTIALS_HASH_ITERATIONS = 10000
+
+# Salt of the credential digests, random per process
+_credentials_salt = os.urandom(16)
+
+
+def token_digest(token: str) -> str:
+    """
+    Returns the SHA-256 digest of a raw token.
+
+    Digests are used as cache keys so that raw tokens are never
+    kept around as dictionary keys.
+    """
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def credentials_digest(username: str, password: str) -> str:
+    """
+    Returns a salted PBKDF2 digest of user credentials.
+
+    The digest is slow to compute on purpose, so that cached entries
+    don't make the credentials cheap to brute force.
+    """
+    return hashlib.pbkdf2_hmac(
+        "sha256",
+        f"{username}:{password}".encode("utf-8"),
+        _credentials_salt,
+        CREDENTIALS_HASH_ITERATIONS,
+    ).hex()
+
+
+class TokenCache:
+    """
+    Thread-safe, size-bounded cache keyed by token digest.
+
+    An entry lives at most `ttl` seconds and never outlives the
+    expiration time (`exp`) of the token it was computed from.
+    A `maxsize` of 0 disables the in-process cache.
+
+    When `shared_cache` names a Django cache alias, entries are also
+    stored there, so that other workers and hosts can reuse them.
+    The shared cache is only looked up on in-process misses.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        namespace: str = "token",
+        shared_cache: Optional[str] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.namespace = namespace
+        self.shared_cache = shared_cache
+        self.hits = 0
+        self.misses = 0
+        self.shared_hits = 0
+        self._lock = threading.Lock()
+        self._cache = TLRUCache(
+            maxsize=max(maxsize, 1), ttu=self._time_to_use, timer=time.time
+        )
+
+    def _time_to_use(self, key: str, entry: tuple, now: float) -> float:
+        """
+        Computes the expiration time of an entry, bounded by the token `exp`.
+        """
+        expires_at, _ = entry
+        if expires_at is None:
+            return now + self.ttl
+        return min(now + self.ttl, expires_at)
+
+    def _shared_key(self, digest: str) -> str:
+        return f"django_keycloak:{self.namespace}:{digest}"
+
+    def _get_shared(self, digest: str) -> Optional[tuple]:
+        """
+        Returns the `(expires_at, value)` entry stored in the shared cache.
+        Shared cache failures are logged and treated as misses.
+        """
+        try:
+            return caches[self.shared_cache].get(self._shared_key(digest))
+        except Exception as err:
+            logger.warning(
+                "Shared cache '%s' lookup failed: %s", self.shared_cache, err
+            )
+            return None
+
+    def _set_shared(self, digest: str, entry: tuple) -> None:
+        """
+        Stores an `(expires_at, value)` entry in the shared cache.
+        Shared cache failures are logged and ignored.
+        """
+        expires_at, _ = entry
+        timeout = self.ttl
+        if expires_at is not None:
+            timeout = min(timeout, expires_at - time.time())
+        try:
+            caches[self.shared_cache].set(
+                self._shared_key(digest), entry, timeout=max(int(timeout), 1)
+            )
+        except Exception as err:
+            logger.warning(
+                "Shared cache '%s' update failed: %s", self.shared_cache, err
+            )
+
+    def get(self, token: str) -> Optional[Any]:
+        """
+        Returns the value cached for `token` or `None` if there is no
+        (unexpired) entry.
+        """
+        digest = token_digest(token)
+        if self.maxsize > 0:
+            with self._lock:
+                entry = self._cache.get(digest)
+                if entry is not None:
+                    self.hits += 1
+                    return entry[1]
+        entry = self._get_shared(digest) if self.shared_cache else None
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.shared_hits += 1
+            # Promote the shared entry into the in-process cache
+            if self.maxsize > 0:
+                self._cache[digest] = entry
+        return entry[1]
+
+    async def aget(self, token: str) -> Optional[Any]:
+        """
+        Asynchronous counterpart of `get`. Only shared cache lookups
+        are run in a thread.
+        """
+        if not self.shared_cache:
+            return self.get(token)
+        return await sync_to_async(self.get, thread_sensitive=False)(token)
+
+    def set(self, token: str, value: Any, expires_at: Optional[float] = None) -> None:
+        """
+        Caches `value` for `token`.
+
+        Parameters
+        ----------
+        token: str
+            The raw token the value was computed from.
+        value: Any
+            The value to cache.
+        expires_at: float, optional
+            The token expiration as a UNIX timestamp. Values of
+            already expired tokens are not cached.
+        """
+        if expires_at is not None and expires_at <= time.time():
+            return
+        digest, entry = token_digest(token), (expires_at, value)
+        if self.maxsize > 0:
+            with self._lock:
+                self._cache[digest] = entry
+        if self.shared_cache:
+            self._set_shared(digest, entry)
+
+    async def aset(
+        self, token: str, value: Any, expires_at: Optional[float] = None
+    ) -> None:
+        """
+        Asynchronous counterpart of `set`. Only shared cache updates
+        are run in a thread.
+        """
+        if not self.shared_cache:
+            return self.set(token, value, expires_at)
+        return await sync_to_async(self.set, thread_sensitive=False)(
+            token, value, expires_at
+        )
+
+    def delete(self, token: str) -> None:
+        """
+        Removes the entry cached for `token`, if any.
+        """
+        digest = token_digest(token)
+        with self._lock:
+            self._cache.pop(digest, None)
+        if self.shared_cache:
+            try:
+                caches[self.shared_cache].delete(self._shared_key(digest))
+            except Exception as err:
+                logger.warning(
+                    "Shared cache '%s' update failed: %s", self.shared_cache, err
+                )
+
+    def clear(self) -> None:
+        """
+        Removes all in-process entries and resets the hit/miss counters.
+        """
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = self.shared_hits = 0
+
+    @property
+    def stats(self) -> dict:
+        """
+        Returns the cache hit/miss counters and current size.
+        """
+        with self._lock:
+            self._cache.expire()
+            return {
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "size": len(self._cache),
+                "maxsize": self.maxsize,
+            }
@@ -0,0 +1,122 @@
+"""
+Module containing the claims extracted from a validated token.
+"""
+from __future__ import annotations
+
+from typing import FrozenSet, Optional
+
+
+class ClaimSet:
+    """
+    The claims of a validated access token, extracted once.
+
+    Roles and scopes are kept as frozen sets, for cheap membership tests,
+    and the subject and profile fields come from the user info: the token
+    itself (see `USER_INFO_IN_TOKEN`) or the Keycloak userinfo endpoint.
+    `user_info` is `None` until the user info is loaded.
+    """
+
+    __slots__ = (
+        "subject",
+        "username",
+        "name",
+        "given_name",
+        "family_name",
+        "email",
+        "email_verified",
+        "client_roles",
+        "realm_roles",
+        "scopes",
+        "expires_at",
+        "user_info",
+    )
+
+    def __init__(
+        self,
+        subject: Optional[str],
+        username: Optional[str],
+        name: Optional[str],
+        given_name: Optional[str],
+        family_name: Optional[str],
+        email: Optional[str],
+        email_verified: Optional[bool],
+        client_roles: FrozenSet[str],
+        realm_roles: FrozenSet[str],
+        scopes: FrozenSet[str],
+        expires_at: Optional[float],
+        user_info: Optional[dict],
+    ):
+        self.subject = subject
+        self.username = username
+        self.name = name
+        self.given_name = given_name
+        self.family_name = family_name
+        self.email = email
+        self.email_verified = email_verified
+        self.client_roles = client_roles
+        self.realm_roles = realm_roles
+        self.scopes = scopes
+        self.expires_at = expires_at
+        self.user_info = user_info
+
+    @classmethod
+    def from_token_info(
+        cls, token_info: dict, user_info: Optional[dict], client_id: str
+    ) -> ClaimSet:
+        """
+        Extracts the claims from the decoded (or introspected) access
+        token and the user info.
+
+        Parameters
+        ----------
+        token_info: dict
+            The access token information.
+        user_info: dict, optional
+            The user information, which is the token information itself
+            when it includes the user info, or `None` when it isn't loaded
+            yet (the subject and profile fields are then read from the
+            token meanwhile).
+        client_id: str
+            The ID of this client, whose roles are extracted.
+        """
+        profile = token_info if user_info is None else user_info
+        return cls(
+            subject=profile.get("sub"),
+            username=profile.get("preferred_username"),
+            name=profile.get("name"),
+            given_name=profile.get("given_name"),
+            family_name=profile.get("family_name"),
+            email=profile.get("email"),
+            email_verified=profile.get("email_verified"),
+            client_roles=frozenset(
+                token_info.get("resource_access", {})
+                .get(client_id, {})
+                .get("roles", [])
+            ),
+            realm_roles=frozenset(token_info.get("realm_access", {}).get("roles", [])),
+            scopes=frozenset(token_info.get("scope", "").split()),
+            expires_at=token_info.get("exp"),
+            user_info=user_info,
+        )
+
+    def with_user_info(self, user_info: Optional[dict]) -> ClaimSet:
+        """
+        Returns the claims with the subject and profile fields
+        of `user_info`, or the claims themselves without user info.
+        """
+        if user_info is None:
+            return self
+        return ClaimSet(
+            subject=user_info.get("sub"),
+            username=user_info.get("preferred_username"),
+            name=user_info.get("name"),
+            given_name=user_info.get("given_name"),
+            family_name=user_info.get("family_name"),
+            email=user_info.get("email"),
+            email_verified=user_info.get("email_verified"),
+            client_roles=self.client_roles,
+            realm_roles=self.realm_roles,
+            scopes=self.scopes,
+            expires_at=self.expires_at,
+            user_info=user_info,
+        )
@@ -27,6 +27,8 @@ class Settings:
     REALM_ADMIN_ROLE: str
     # Regex formatted URLs to skip authentication (uses re.match())
     EXEMPT_URIS: Optional[List] = field(default_factory=list)
+    # Maximum number of paths whose "EXEMPT_URIS" match is remembered
+    EXEMPT_URIS_CACHE_SIZE: Optional[int] = 1024
     # Overrides SERVER_URL for Keycloak admin calls
     INTERNAL_URL: Optional[str] = None
     # Override default Keycloak base path (/auth/)
@@ -37,10 +39,91 @@ class Settings:
     VERIFY_AUDIENCE: Optional[bool] = True
     # Flag if the user info has been included in the token
     USER_INFO_IN_TOKEN: Optional[bool] = True
+    # Flag to validate tokens and sync users only when the request user is accessed
+    LAZY_AUTHENTICATION: Optional[bool] = False
+    # Flag to check the admin client permissions when it first connects
+    ADMIN_STARTUP_PROBE: Optional[bool] = True
+    # Flag to add the time spent in Keycloak calls to the Server-Timing header
+    SERVER_TIMING: Optional[bool] = False
+    # Flag to export the Keycloak metrics to the default Prometheus registry
+    PROMETHEUS_METRICS: Optional[bool] = False
     # Flag to show the traceback of debug logs
     TRACE_DEBUG_LOGS: Optional[bool] = False
     # The token prefix
     TOKEN_PREFIX: Optional[str] = "Bearer"
+    # Minimum time, in seconds, between two fetches of the realm signing keys
+    JWKS_MIN_REFRESH_INTERVAL: Optional[int] = 30
+    # Maximum number of verified token claims kept in memory (0 disables it)
+    TOKEN_CACHE_SIZE: Optional[int] = 1024
+    # Maximum time, in seconds, verified token claims are kept in memory
+    TOKEN_CACHE_TTL: Optional[int] = 60
+    # Maximum number of invalid tokens remembered (0 disables it)
+    INVALID_TOKEN_CACHE_SIZE: Optional[int] = 1024
+    # Time, in seconds, invalid tokens are rejected without validating them again
+    INVALID_TOKEN_CACHE_TTL: Optional[int] = 10
+    # Maximum number of userinfo responses kept in memory (0 disables it)
+    USER_INFO_CACHE_SIZE: Optional[int] = 1024
+    # Maximum time, in seconds, userinfo responses are kept in memory
+    USER_INFO_CACHE_TTL: Optional[int] = 60
+    # Maximum number of tokens issued for "Basic" auth credentials kept in memory
+    # (0 disables it)
+    BASIC_AUTH_CACHE_SIZE: Optional[int] = 256
+    # Maximum time, in seconds, tokens issued for "Basic" auth credentials are
+    # reused or refreshed before authenticating the credentials again
+    BASIC_AUTH_CACHE_TTL: Optional[int] = 3600
+    # Time, in seconds, before their expiration when cached tokens are renewed
+    BASIC_AUTH_REFRESH_LEEWAY: Optional[int] = 30
+    # Minimum time, in seconds, between two syncs of a user profile from the
+    # token claims (0 syncs it on every request)
+    PROFILE_SYNC_INTERVAL: Optional[int] = 0
+    # Maximum number of users whose last profile sync is remembered
+    PROFILE_SYNC_CACHE_SIZE: Optional[int] = 10000
+    # Flag to queue the user creations and updates made by the middleware, and
+    # write them in batches
+    USER_WRITE_BEHIND: Optional[bool] = False
+    # Maximum number of queued user writes before writing them
+    USER_WRITE_BEHIND_BATCH_SIZE: Optional[int] = 100
+    # Maximum time, in seconds, user writes stay queued
+    USER_WRITE_BEHIND_INTERVAL: Optional[float] = 1
+    # Maximum number of local users kept in memory, by Keycloak id (0 disables it)
+    USER_CACHE_SIZE: Optional[int] = 1024
+    # Maximum time, in seconds, local users are kept in memory, i.e. how long
+    # changes made by other workers (e.g. deactivations) may go unnoticed
+    USER_CACHE_TTL: Optional[int] = 5
+    # Maximum number of user profiles from the admin API kept in memory
+    # (0 disables it)
+    ADMIN_PROFILE_CACHE_SIZE: Optional[int] = 1024
+    # Maximum time, in seconds, user profiles from the admin API are kept in memory
+    ADMIN_PROFILE_CACHE_TTL: Optional[int] = 300
+    # Maximum number of concurrent admin API requests when prefetching user
+    # profiles
+    ADMIN_PREFETCH_WORKERS: Optional[int] = 8
+    # Django cache alias used to share the local users and their profiles from the
+    # admin API between workers
+    USER_SHARED_CACHE: Optional[str] = None
+    # Django cache alias storing the time of the last users sync, for the
+    # incremental syncs
+    USER_SYNC_CACHE: Optional[str] = "default"
+    # Django cache alias used to share introspection and userinfo results
+    # between workers
+    TOKEN_SHARED_CACHE: Optional[str] = None
+    # Flag to coalesce concurrent token validations across processes, using a
+    # lock in the `TOKEN_SHARED_CACHE`
+    SINGLE_FLIGHT_SHARED_LOCK: Optional[bool] = False
+    # Maximum time, in seconds, to wait for a token validation of another process
+    SINGLE_FLIGHT_TIMEOUT: Optional[int] = 5
+    # Maximum number of Keycloak hosts kept in the HTTP connection pools
+    HTTP_POOL_CONNECTIONS: Optional[int] = 10
+    # Maximum number of connections kept alive per Keycloak host
+    HTTP_POOL_MAXSIZE: Optional[int] = 10
+    # Time, in seconds, idle connections are kept alive by the async client
+    HTTP_KEEPALIVE_EXPIRY: Optional[float] = 5
+    # Timeout, in seconds, to connect to Keycloak
+    HTTP_CONNECT_TIMEOUT: Optional[float] = 10
+    # Timeout, in seconds, to read a response from Keycloak
+    HTTP_READ_TIMEOUT: Optional[float] = 60
+    # Number of retries of requests failing to connect to Keycloak
+    HTTP_MAX_RETRIES: Optional[int] = 1
     # Derived setting of the SERVER/INTERNAL_URL and BASE_PATH
     KEYCLOAK_URL: str = field(init=False)
 
@@ -0,0 +1,125 @@
+"""
+Module providing the pooled HTTP session shared by all Keycloak clients.
+"""
+from typing import List, Optional
+
+import requests
+from keycloak.connection import ConnectionManager
+from requests.adapters import HTTPAdapter
+
+from django_keycloak.config import settings
+from django_keycloak.instrumentation import timed
+
+# The (connect, read) timeouts of all Keycloak calls
+TIMEOUT = (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+
+def build_session() -> requests.Session:
+    """
+    Builds a `requests` session keeping connections to Keycloak alive
+    in pools sized by the `HTTP_POOL_*` settings.
+    """
+    session = requests.Session()
+    session.auth = lambda x: x  # don't let requests add auth headers
+    for protocol in ("https://", "http://"):
+        adapter = HTTPAdapter(
+            pool_connections=settings.HTTP_POOL_CONNECTIONS,
+            pool_maxsize=settings.HTTP_POOL_MAXSIZE,
+            max_retries=settings.HTTP_MAX_RETRIES,
+        )
+        # Like `ConnectionManager`, retry POST requests too, to reset
+        # connections closed by Keycloak
+        allowed_methods = set(adapter.max_retries.allowed_methods)
+        allowed_methods.add("POST")
+        adapter.max_retries.allowed_methods = frozenset(allowed_methods)
+        session.mount(protocol, adapter)
+    return session
+
+
+# The exported session shared by the OpenID and admin clients
+http_session = build_session()
+
+
+class PooledConnectionManager(ConnectionManager):
+    """
+    Overrides `ConnectionManager` from `python-keycloak` to send requests
+    through the shared `http_session`, with the configured timeouts.
+    When `operation` is given, requests are measured as that operation
+    (see `django_keycloak.instrumentation`).
+    """
+
+    def __init__(self, base_url, headers=None, verify=True, operation=None):
+        super().__init__(
+            base_url, headers=headers or {}, timeout=TIMEOUT, verify=verify
+        )
+        # Replace the session created by the parent constructor
+        self._s.close()
+        self._s = http_session
+        self.operation: Optional[str] = operation
+
+    def raw_get(self, path, **kwargs):
+        if self.operation is None:
+            return super().raw_get(path, **kwargs)
+        with timed(self.operation):
+            return super().raw_get(path, **kwargs)
+
+    def raw_post(self, path, data, **kwargs):
+        if self.operation is None:
+            return super().raw_post(path, data, **kwargs)
+        with timed(self.operation):
+            return super().raw_post(path, data, **kwargs)
+
+    def raw_put(self, path, data, **kwargs):
+        if self.operation is None:
+            return super().raw_put(path, data, **kwargs)
+        with timed(self.operation):
+            return super().raw_put(path, data, **kwargs)
+
+    def raw_delete(self, path, data=None, **kwargs):
+        if self.operation is None:
+            return super().raw_delete(path, data=data, **kwargs)
+        with timed(self.operation):
+            return super().raw_delete(path, data=data, **kwargs)
+
+    def __del__(self):
+        # The shared session outlives the connection managers
+        pass
+
+    @classmethod
+    def from_connection(
+        cls, connection: ConnectionManager, operation: Optional[str] = None
+    ):
+        """
+        Creates a pooled connection manager with the same URL, headers
+        and SSL verification as `connection`.
+        """
+        return cls(
+            connection.base_url,
+            connection.headers,
+            connection.verify,
+            operation=operation,
+        )
+
+
+def pool_stats() -> List[dict]:
+    """
+    Returns the state of the connection pool of each Keycloak host.
+    """
+    stats = []
+    for adapter in set(http_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools[key]
+            stats.append(
+                {
+                    "host": f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                    "connections": pool.num_connections,
+                    "requests": pool.num_requests,
+                    # The pool queue is filled with `None` placeholders
+                    "idle": sum(conn is not None for conn in pool.pool.queue)
+                    if pool.pool
+                    else 0,
+                    "maxsize": settings.HTTP_POOL_MAXSIZE,
+                }
+            )
+    return stats
@@ -1,73 +1,122 @@
 """
 Module to interact with Keycloak Admin API
 """
-from typing import Dict, List
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable
 
 from keycloak.exceptions import KeycloakAuthenticationError, KeycloakGetError
 from keycloak.keycloak_admin import KeycloakAdmin
 
+from django_keycloak.cache import TokenCache
 from django_keycloak.config import settings
+from django_keycloak.connection import TIMEOUT, PooledConnectionManager
+from django_keycloak.instrumentation import ADMIN
 from django_keycloak.errors import (
     KeycloakMissingServiceAccountRolesError,
     KeycloakNoServiceAccountRolesError,
 )
 
-_args: List
-_kwargs: Dict
-_initialized: bool = False
+logger = logging.getLogger(__name__)
 
 
-class LazyKeycloakAdmin(KeycloakAdmin):
+class PooledKeycloakAdmin(KeycloakAdmin):
     """
-    Overrides `KeycloakAdmin` from `python-keycloak`,
-    to provide a mechanism to lazy load the connection to
-    Keycloak's server and re-use the same connection on
-    subsequent requests, thus eliminating the connection overhead.
+    Overrides `KeycloakAdmin` from `python-keycloak`, to send the admin
+    requests through the shared pooled session.
     """
 
-    def __init__(self, *args, **kwargs):
-        global _args, _kwargs
-        _args, _kwargs = args, kwargs
+    def get_token(self):
+        """
+        Overrides `KeycloakAdmin.get_token` to send the admin requests
+        through the shared pooled session, which the parent method
+        would replace with new connections, measuring them as `ADMIN`.
+        """
+        super().get_token()
+        self.keycloak_openid.connection = PooledConnectionManager.from_connection(
+            self.keycloak_openid.connection, operation=ADMIN
+        )
+        self.connection = PooledConnectionManager.from_connection(
+            self.connection, operation=ADMIN
+        )
+
+
+class LazyKeycloakAdmin:
+    """
+    Lazy proxy to a `PooledKeycloakAdmin`, to only connect to Keycloak's
+    server on first use and re-use the same connection on subsequent
+    requests, thus eliminating the connection overhead.
+
+    The admin client is initialized exactly once, under a lock. The proxy
+    then becomes the client itself (its class and attributes are replaced),
+    so that later calls don't go through the proxy at all.
+    """
+
+    def __init__(self, *args, probe: bool = True, **kwargs):
+        self._lazy_args = args
+        self._lazy_kwargs = kwargs
+        self._lazy_probe = probe
+        self._lazy_lock = threading.Lock()
 
-    def __getattribute__(self, item):
+    def __getattr__(self, item):
         """
-        Intercepts a method call for `KeycloakAdmin`.
-        If no instance has been previously initialized, we
-        call the parent constructor to create a new one, and
-        save a flag to re-use the same instance on following requests.
+        Initializes the admin client on the first access to an attribute
+        the proxy doesn't have.
         """
-        global _initialized, _args, _kwargs
-        if not _initialized:
-            _initialized = True
-            self.handle_keycloak_init(_args, _kwargs)
-        # Calling the super class to avoid recursion
-        return super().__getattribute__(item)
-
-    def handle_keycloak_init(self, args, kwargs):
+        # Avoid recursing on the proxy's own attributes, and connecting
+        # on introspection (e.g. `copy`, `inspect` or `mock` probes)
+        if item.startswith("_lazy_") or (item.startswith("__") and item.endswith("__")):
+            raise AttributeError(item)
+        self._lazy_init()
+        return getattr(self, item)
+
+    def _lazy_init(self):
         """
-        Calls the parent constructor to initialize a
-        Keycloak connection.
+        Initializes the admin client, unless another thread did it first.
         """
-        try:
-            super().__init__(*args, **kwargs)
+        with self._lazy_lock:
+            if isinstance(self, PooledKeycloakAdmin):
+                return
+            admin = connect_keycloak_admin(
+                self._lazy_args, self._lazy_kwargs, probe=self._lazy_probe
+            )
+            self.__dict__.update(admin.__dict__)
+            self.__class__ = PooledKeycloakAdmin
+
+
+def connect_keycloak_admin(args, kwargs, probe: bool = True) -> PooledKeycloakAdmin:
+    """
+    Creates an admin client connected to Keycloak.
+
+    Raises:
+        KeycloakMissingServiceAccountRolesError: If the probe can't list
+            the users (with `probe`)
+        KeycloakNoServiceAccountRolesError: If the client has no service
+            account
+    """
+    try:
+        admin = PooledKeycloakAdmin(*args, **kwargs)
+        if probe:
             # Try to call a users method
             # if error occurs a required role is missing
             # https://github.com/marcospereirampj/python-keycloak/issues/87
             try:
-                self.users_count()
+                admin.users_count()
             except KeycloakGetError as error:
                 if "unknown_error" in str(error):
                     raise KeycloakMissingServiceAccountRolesError from error
                 else:
                     raise error
-        except KeycloakAuthenticationError as error:
-            # Check if the error is due to service account not being enabled
-            if "Client not enabled to retrieve service account" in str(error):
-                raise KeycloakNoServiceAccountRolesError from error
+        return admin
+    except KeycloakAuthenticationError as error:
+        # Check if the error is due to service account not being enabled
+        if "Client not enabled to retrieve service account" in str(error):
+            raise KeycloakNoServiceAccountRolesError from error
 
-            # Otherwise re-throw the original error
-            else:
-                raise error
+        # Otherwise re-throw the original error
+        else:
+            raise error
 
 
 # The exported module variable
@@ -76,4 +125,70 @@ lazy_keycloak_admin = LazyKeycloakAdmin(
     client_id=settings.CLIENT_ID,
     realm_name=settings.REALM,
     client_secret_key=settings.CLIENT_SECRET_KEY,
+    timeout=TIMEOUT,
+    probe=settings.ADMIN_STARTUP_PROBE,
 )
+
+# The user representations of the admin API, keyed by Keycloak id
+profile_cache = TokenCache(
+    maxsize=settings.ADMIN_PROFILE_CACHE_SIZE,
+    ttl=settings.ADMIN_PROFILE_CACHE_TTL,
+    namespace="profile",
+    shared_cache=settings.USER_SHARED_CACHE,
+)
+
+
+def get_user_profile(keycloak_id) -> dict:
+    """
+    Returns the user representation of the admin API, from `profile_cache`
+    when possible.
+
+    Raises:
+        KeycloakError: On Keycloak API errors
+    """
+    profile = profile_cache.get(str(keycloak_id))
+    if profile is None:
+        profile = lazy_keycloak_admin.get_user(keycloak_id)
+        profile_cache.set(str(keycloak_id), profile)
+    return profile
+
+
+def get_user_profiles(
+    keycloak_ids: Iterable, max_workers: int = None
+) -> Dict[str, dict]:
+    """
+    Returns the user representations of the admin API by Keycloak id (as
+    strings), fetching those missing from `profile_cache` concurrently, with
+    at most `max_workers` (or `ADMIN_PREFETCH_WORKERS`) requests at once.
+    Profiles that fail to load are left out (and logged).
+    """
+    profiles, missing = {}, []
+    for keycloak_id in {str(keycloak_id) for keycloak_id in keycloak_ids}:
+        profile = profile_cache.get(keycloak_id)
+        if profile is None:
+            missing.append(keycloak_id)
+        else:
+            profiles[keycloak_id] = profile
+    if not missing:
+        return profiles
+
+    def fetch(keycloak_id):
+        try:
+            return lazy_keycloak_admin.get_user(keycloak_id)
+        except Exception as err:
+            logger.warning(
+                "Failed to load the profile of user %s: %s", keycloak_id, err
+            )
+            return None
+
+    workers = min(max_workers or settings.ADMIN_PREFETCH_WORKERS, len(missing))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            fetched = list(executor.map(fetch, missing))
+    else:
+        fetched = [fetch(keycloak_id) for keycloak_id in missing]
+    for keycloak_id, profile in zip(missing, fetched):
+        if profile is not None:
+            profile_cache.set(keycloak_id, profile)
+            profiles[keycloak_id] = profile
+    return profiles
@@ -0,0 +1,57 @@
+"""
+Module to match request paths against the URIs exempt from authentication.
+"""
+import re
+from functools import lru_cache
+from typing import Iterable, List, Pattern, Tuple
+
+# Characters with a special meaning in regular expressions
+_SPECIAL_CHARS = frozenset(".^$*+?{}[]\\|()")
+
+# Back-references and global inline flags change meaning once patterns
+# are combined
+_NOT_COMBINABLE = re.compile(r"\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)")
+
+
+class ExemptMatcher:
+    """
+    Matches paths against a list of regular expressions, with the
+    `re.match` semantics used by the `EXEMPT_URIS` setting.
+
+    The patterns are compiled once: literal patterns become prefixes
+    checked with `str.startswith`, and the rest are combined into a
+    single regular expression. Patterns that can't be combined (e.g.
+    with back-references or inline flags) are matched one by one.
+    The results of the last `cache_size` paths are remembered.
+    """
+
+    def __init__(self, patterns: Iterable[str], cache_size: int = 1024):
+        prefixes, combinable, separate = [], [], []
+        for pattern in patterns:
+            if not _SPECIAL_CHARS.intersection(pattern):
+                prefixes.append(pattern)
+            elif _NOT_COMBINABLE.search(pattern):
+                separate.append(pattern)
+            else:
+                combinable.append(pattern)
+
+        self.prefixes: Tuple[str, ...] = tuple(prefixes)
+        self.regexes: List[Pattern] = []
+        if combinable:
+            try:
+                self.regexes.append(
+                    re.compile("|".join(f"(?:{pattern})" for pattern in combinable))
+                )
+            except re.error:
+                separate.extend(combinable)
+        self.regexes.extend(re.compile(pattern) for pattern in separate)
+
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    def _match(self, path: str) -> bool:
+        """
+        Checks if the path matches any of the patterns.
+        """
+        if path.startswith(self.prefixes):
+            return True
+        return any(regex.match(path) for regex in self.regexes)
@@ -0,0 +1,201 @@
+"""
+Module to measure the time spent in Keycloak calls and user syncs.
+
+Every measured operation is sent through the `keycloak_operation` signal
+(with the operation name as sender), recorded for the `Server-Timing`
+header of the current request when `SERVER_TIMING` is enabled, and
+exported as Prometheus metrics when `PROMETHEUS_METRICS` is enabled
+(requires the optional `prometheus_client` dependency).
+"""
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from django.dispatch import Signal
+
+# Operation names
+DECODE = "decode"
+INTROSPECT = "introspect"
+USERINFO = "userinfo"
+PASSWORD_GRANT = "password_grant"
+REFRESH = "refresh"
+JWKS = "jwks"
+ADMIN = "admin"
+USER_SYNC = "user_sync"
+
+# Sent after each measured operation, with the operation name as sender and
+# the `duration` (in seconds) and `error` (exception or `None`) arguments
+keycloak_operation = Signal()
+
+# The (count, total duration) of each operation of the current request
+_request_timings: ContextVar[Optional[Dict[str, Tuple[int, float]]]] = ContextVar(
+    "django_keycloak_request_timings", default=None
+)
+
+
+def start_request() -> None:
+    """
+    Starts recording the operations of the current request.
+    """
+    _request_timings.set({})
+
+
+def end_request() -> Dict[str, Tuple[int, float]]:
+    """
+    Stops recording the operations of the current request,
+    returning their (count, total duration) by operation name.
+    """
+    timings = _request_timings.get()
+    _request_timings.set(None)
+    return timings or {}
+
+
+def server_timing(timings: Dict[str, Tuple[int, float]]) -> str:
+    """
+    Formats request timings as a `Server-Timing` header value.
+    """
+    return ", ".join(
+        f'keycloak-{operation};dur={total * 1000:.1f};desc="{count}x"'
+        for operation, (count, total) in timings.items()
+    )
+
+
+def record(operation: str, duration: float, error: Optional[Exception] = None):
+    """
+    Records a measured operation.
+    """
+    timings = _request_timings.get()
+    if timings is not None:
+        count, total = timings.get(operation, (0, 0.0))
+        timings[operation] = (count + 1, total + duration)
+    if keycloak_operation.has_listeners(operation):
+        keycloak_operation.send(sender=operation, duration=duration, error=error)
+
+
+@contextmanager
+def timed(operation: str):
+    """
+    Measures the block of code run in the context as `operation`.
+    """
+    start = time.perf_counter()
+    error = None
+    try:
+        yield
+    except Exception as err:
+        error = err
+        raise
+    finally:
+        record(operation, time.perf_counter() - start, error)
+
+
+def cache_stats() -> Dict[str, dict]:
+    """
+    Returns the hit/miss counters of the caches, by cache name.
+    """
+    from django_keycloak.resolver import user_resolver
+    from django_keycloak.token import (
+        claims_cache,
+        credentials_cache,
+        invalid_tokens_cache,
+        user_info_cache,
+    )
+
+    return {
+        "claims": claims_cache.stats,
+        "invalid_tokens": invalid_tokens_cache.stats,
+        "userinfo": user_info_cache.stats,
+        "credentials": credentials_cache.stats,
+        "users": user_resolver.cache.stats,
+    }
+
+
+class PrometheusCollector:
+    """
+    Exports the measured operations as a latency histogram and an error
+    counter, and the cache counters, as Prometheus metrics.
+
+    Raises:
+        ImportError: If `prometheus_client` is not installed
+    """
+
+    def __init__(self, registry=None):
+        try:
+            import prometheus_client
+            from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+        except ImportError as err:
+            raise ImportError(
+                "The Prometheus metrics require 'prometheus_client'. "
+                "Install it with 'pip install prometheus-client'."
+            ) from err
+
+        self._counter_family = CounterMetricFamily
+        self._gauge_family = GaugeMetricFamily
+        registry = registry or prometheus_client.REGISTRY
+        self.durations = prometheus_client.Histogram(
+            "django_keycloak_operation_seconds",
+            "Duration of the Keycloak calls and user syncs",
+            ["operation"],
+            registry=registry,
+        )
+        self.errors = prometheus_client.Counter(
+            "django_keycloak_operation_errors",
+            "Failed Keycloak calls and user syncs",
+            ["operation"],
+            registry=registry,
+        )
+        registry.register(self)
+
+    def observe(self, sender: str, duration: float, error=None, **kwargs) -> None:
+        """
+        Receiver of the `keycloak_operation` signal.
+        """
+        self.durations.labels(sender).observe(duration)
+        if error is not None:
+            self.errors.labels(sender).inc()
+
+    def collect(self):
+        """
+        Yields the cache metrics, for the Prometheus registry.
+        """
+        hits = self._counter_family(
+            "django_keycloak_cache_hits",
+            "Cache hits, in-process or shared",
+            labels=["cache", "tier"],
+        )
+        misses = self._counter_family(
+            "django_keycloak_cache_misses", "Cache misses", labels=["cache"]
+        )
+        size = self._gauge_family(
+            "django_keycloak_cache_size", "Cache entries", labels=["cache"]
+        )
+        for name, stats in cache_stats().items():
+            hits.add_metric([name, "local"], stats["hits"])
+            hits.add_metric([name, "shared"], stats["shared_hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+        yield hits
+        yield misses
+        yield size
+
+
+# The Prometheus collector, once enabled
+prometheus_collector: Optional[PrometheusCollector] = None
+
+
+def enable_prometheus(registry=None) -> PrometheusCollector:
+    """
+    Exports the Keycloak metrics to a Prometheus registry (the default
+    registry if not given). Does nothing if they are already exported.
+
+    Raises:
+        ImportError: If `prometheus_client` is not installed
+    """
+    global prometheus_collector
+    if prometheus_collector is None:
+        prometheus_collector = PrometheusCollector(registry)
+        keycloak_operation.connect(
+            prometheus_collector.observe,
+            dispatch_uid="django_keycloak_prometheus",
+        )
+    return prometheus_collector
@@ -0,0 +1,110 @@
+"""
+Module to keep the Keycloak realm signing keys (JWKS) used for token decoding.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from asgiref.sync import sync_to_async
+from jose import jwk
+from jose.backends.base import Key
+from jose.exceptions import JOSEError, JWKError
+
+from django_keycloak.config import settings
+from django_keycloak.instrumentation import JWKS, timed
+
+logger = logging.getLogger(__name__)
+
+# The algorithm assumed for keys which don't advertise one
+DEFAULT_ALGORITHM = "RS256"
+
+
+class KeyStore:
+    """
+    Keeps the realm JSON Web Key Set parsed and indexed by key id
+    (`kid`) and algorithm.
+
+    The key set is fetched on first use and only fetched again when a
+    token signed with an unknown key arrives (i.e. after a key rotation),
+    at most once every `min_refresh_interval` seconds.
+    """
+
+    def __init__(self, fetch: Callable[[], dict], min_refresh_interval: float):
+        self._fetch = fetch
+        self.min_refresh_interval = min_refresh_interval
+        self._keys: Dict[Tuple[str, str], Key] = {}
+        self._last_refresh: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        """
+        Fetches the key set and replaces the known keys.
+        Keys which are not meant for signatures or can't be parsed are skipped.
+
+        Raises:
+            KeycloakError: On Keycloak API errors
+        """
+        keys = {}
+        with timed(JWKS):
+            key_set = self._fetch()
+        for key_data in key_set.get("keys", []):
+            if key_data.get("use", "sig") != "sig":
+                continue
+            algorithm = key_data.get("alg", DEFAULT_ALGORITHM)
+            try:
+                keys[(key_data.get("kid"), algorithm)] = jwk.construct(
+                    key_data, algorithm
+                )
+            except JOSEError as err:
+                logger.debug(
+                    "Skipping key '%s': %s",
+                    key_data.get("kid"),
+                    err,
+                    exc_info=settings.TRACE_DEBUG_LOGS,
+                )
+        self._keys = keys
+        self._last_refresh = time.monotonic()
+
+    def get_key(self, kid: Optional[str], algorithm: str) -> Key:
+        """
+        Returns the parsed key for the given key id and algorithm,
+        refreshing the key set if the key is unknown.
+
+        Raises:
+            JWKError: If no matching key exists
+            KeycloakError: On Keycloak API errors
+        """
+        key = self._keys.get((kid, algorithm))
+        if key is not None:
+            return key
+        with self._lock:
+            # Another thread may have refreshed the keys while waiting
+            key = self._keys.get((kid, algorithm))
+            if key is None and self._can_refresh():
+                self.refresh()
+                key = self._keys.get((kid, algorithm))
+        if key is None:
+            raise JWKError(
+                f"Unable to find a signing key for kid '{kid}' ({algorithm})"
+            )
+        return key
+
+    async def aget_key(self, kid: Optional[str], algorithm: str) -> Key:
+        """
+        Asynchronous counterpart of `get_key`. Only key set refreshes
+        are run in a thread.
+        """
+        key = self._keys.get((kid, algorithm))
+        if key is not None:
+            return key
+        return await sync_to_async(self.get_key, thread_sensitive=False)(kid, algorithm)
+
+    def _can_refresh(self) -> bool:
+        """
+        Checks if the rate limit allows fetching the key set again.
+        """
+        return (
+            self._last_refresh is None
+            or time.monotonic() - self._last_refresh >= self.min_refresh_interval
+        )
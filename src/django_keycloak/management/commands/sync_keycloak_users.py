@@ -1,28 +1,422 @@
 import logging as log
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from itertools import islice
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.management.base import BaseCommand
+from django.db import connections, router
+from django.utils import timezone as dj_timezone
+from keycloak import urls_patterns
+from keycloak.exceptions import KeycloakGetError, raise_error_from_response
 
-from django_keycloak.connector import lazy_keycloak_admin
+from django_keycloak.config import settings
+from django_keycloak.connector import (
+    get_user_profiles,
+    lazy_keycloak_admin,
+    profile_cache,
+)
+
+# Number of Keycloak users fetched per request
+DEFAULT_PAGE_SIZE = 100
+# Number of local users read, written or deleted per query
+DEFAULT_CHUNK_SIZE = 1000
+
+# Cache key of the time (in milliseconds) up to which users are synced
+SYNC_MARK_KEY = "django_keycloak:user_sync_mark"
+# Margin, in milliseconds, for the clock difference with Keycloak
+CLOCK_SKEW_MARGIN = 60 * 1000
+
+# User events changing users, and whether they delete them
+USER_EVENT_TYPES = {
+    "REGISTER": False,
+    "UPDATE_PROFILE": False,
+    "UPDATE_EMAIL": False,
+    "DELETE_ACCOUNT": True,
+}
+
+
+def iter_remote_users(page_size: int = DEFAULT_PAGE_SIZE) -> Iterator[dict]:
+    """
+    Yields the (brief) representations of the Keycloak users,
+    fetching them page by page.
+    """
+    first = 0
+    while True:
+        page = lazy_keycloak_admin.get_users(
+            {"first": first, "max": page_size, "briefRepresentation": True}
+        )
+        yield from page
+        if len(page) < page_size:
+            return
+        first += page_size
+
+
+def get_superusers() -> Set[str]:
+    """
+    Returns the Keycloak ids of the users with the realm or the client
+    admin role (see `REALM_ADMIN_ROLE` and `CLIENT_ADMIN_ROLE`). Only the
+    users given the role directly are listed, not through a group or a
+    composite role.
+    """
+    members = list(
+        lazy_keycloak_admin.get_realm_role_members(settings.REALM_ADMIN_ROLE)
+    )
+    client_id = lazy_keycloak_admin.get_client_id(settings.CLIENT_ID)
+    if client_id:
+        members.extend(
+            lazy_keycloak_admin.get_client_role_members(
+                client_id, settings.CLIENT_ADMIN_ROLE
+            )
+        )
+    return {member["id"] for member in members}
+
+
+def get_events_config() -> dict:
+    """
+    Returns the events configuration of the realm.
+    """
+    url = urls_patterns.URL_ADMIN_EVENTS_CONFIG.format(
+        **{"realm-name": lazy_keycloak_admin.realm_name}
+    )
+    return raise_error_from_response(lazy_keycloak_admin.raw_get(url), KeycloakGetError)
+
+
+def get_admin_events(query: dict) -> list:
+    """
+    Returns the admin events of the realm, newest first.
+    """
+    url = f"admin/realms/{lazy_keycloak_admin.realm_name}/admin-events"
+    return raise_error_from_response(
+        lazy_keycloak_admin.raw_get(url, **query), KeycloakGetError
+    )
+
+
+def iter_events(
+    fetch: Callable[[dict], list], query: dict, since: int, page_size: int
+) -> Iterator[dict]:
+    """
+    Yields the events returned by `fetch` (newest first) from `since`
+    (a UNIX timestamp in milliseconds), fetching them page by page.
+    """
+    # `dateFrom` only has a day precision, in the Keycloak timezone
+    date_from = datetime.fromtimestamp(since / 1000, timezone.utc) - timedelta(days=1)
+    query = {**query, "dateFrom": date_from.strftime("%Y-%m-%d"), "max": page_size}
+    first = 0
+    while True:
+        page = fetch({**query, "first": first})
+        for event in page:
+            if event["time"] < since:
+                return
+            yield event
+        if len(page) < page_size:
+            return
+        first += page_size
+
+
+def get_user_changes(
+    since: int, user_events: bool, page_size: int = DEFAULT_PAGE_SIZE
+) -> Tuple[Dict[str, bool], int]:
+    """
+    Returns whether each user created, updated or deleted in Keycloak since
+    `since` (a UNIX timestamp in milliseconds) was deleted, by Keycloak id,
+    and the time of the last change.
+    The changes are read from the admin events and, with `user_events`,
+    the user events (e.g. self-registrations).
+    """
+    # The last (time, deleted) of each user
+    changes: Dict[str, Tuple[int, bool]] = {}
+
+    def add(keycloak_id: str, event_time: int, deleted: bool) -> None:
+        if keycloak_id and changes.get(keycloak_id, (-1,))[0] <= event_time:
+            changes[keycloak_id] = (event_time, deleted)
+
+    admin_events = iter_events(
+        get_admin_events, {"resourceTypes": ["USER"]}, since, page_size
+    )
+    for event in admin_events:
+        # e.g. "users/<id>" or "users/<id>/reset-password"
+        path = event.get("resourcePath", "").split("/")
+        if len(path) < 2 or path[0] != "users":
+            continue
+        deleted = event.get("operationType") == "DELETE" and len(path) == 2
+        add(path[1], event["time"], deleted)
+
+    if user_events:
+        events = iter_events(
+            lazy_keycloak_admin.get_events,
+            {"type": list(USER_EVENT_TYPES)},
+            since,
+            page_size,
+        )
+        for event in events:
+            add(event.get("userId"), event["time"], USER_EVENT_TYPES[event["type"]])
+
+    last_change = max((change[0] for change in changes.values()), default=since)
+    return {key: deleted for key, (_, deleted) in changes.items()}, last_change
+
+
+class SeenUsers:
+    """
+    The Keycloak ids of the users seen by a full sync, kept in a temporary
+    table of the `using` database instead of in memory.
+    """
+
+    table = "django_keycloak_seen_users"
+
+    def __init__(self, using: str):
+        self.connection = connections[using]
+        self.quoted_table = self.connection.ops.quote_name(self.table)
+
+    def __enter__(self) -> "SeenUsers":
+        index = self.connection.ops.quote_name(f"{self.table}_id")
+        with self.connection.cursor() as cursor:
+            # Not unique: Keycloak pages may overlap while users are created
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE {self.quoted_table} (keycloak_id CHAR(32))"
+            )
+            cursor.execute(f"CREATE INDEX {index} ON {self.quoted_table} (keycloak_id)")
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE {self.quoted_table}")
+
+    def add(self, keycloak_ids: Iterable) -> None:
+        """
+        Records Keycloak ids as seen.
+        """
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.quoted_table} (keycloak_id) VALUES (%s)",
+                [(uuid.UUID(str(keycloak_id)).hex,) for keycloak_id in keycloak_ids],
+            )
+
+    def unseen(self, keycloak_ids: List) -> List:
+        """
+        Returns the Keycloak ids of a chunk that weren't seen.
+        """
+        by_hex = {uuid.UUID(str(key)).hex: key for key in keycloak_ids}
+        if not by_hex:
+            return []
+        placeholders = ", ".join(["%s"] * len(by_hex))
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT keycloak_id FROM {self.quoted_table} "
+                f"WHERE keycloak_id IN ({placeholders})",
+                list(by_hex),
+            )
+            seen = {row[0] for row in cursor.fetchall()}
+        return [key for hex_id, key in by_hex.items() if hex_id not in seen]
+
+
+def chunked(iterable: Iterable, size: int) -> Iterator[List]:
+    """
+    Splits an iterable into lists of at most `size` items.
+    """
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, size))
 
 
 class Command(BaseCommand):
     help = "Synchronize users with keycloak"
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--page-size",
+            type=int,
+            default=DEFAULT_PAGE_SIZE,
+            help="Number of Keycloak users fetched per request",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=DEFAULT_CHUNK_SIZE,
+            help="Number of local users read, written or deleted per query",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only sync the users changed since the last sync, from the "
+            "Keycloak events (falls back to a full sync when not possible)",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Report the users to create, update and remove without "
+            "changing them (list them with --verbosity 2)",
+        )
+
     def handle(self, *args, **options):
+        self.page_size = options["page_size"]
+        self.chunk_size = options["chunk_size"]
+        self.dry_run = options["dry_run"]
+        self.verbosity = options["verbosity"]
+        self.created = self.updated = self.removed = 0
+        # The Keycloak ids of the admin users, read on first use
+        self.superusers: Optional[Set[str]] = None
+
+        mark_cache = caches[settings.USER_SYNC_CACHE]
+        if options["incremental"] and isinstance(mark_cache, (LocMemCache, DummyCache)):
+            log.warning(
+                "The '%s' cache (USER_SYNC_CACHE) is process-local: the time of the "
+                "last sync is lost when the process exits, so incremental syncs "
+                "run in new processes are full syncs",
+                settings.USER_SYNC_CACHE,
+            )
+        since = mark_cache.get(SYNC_MARK_KEY) if options["incremental"] else None
+        events_config = {}
+        if since is not None:
+            events_config = self.read_events_config()
+            if not events_config.get("adminEventsEnabled"):
+                log.warning(
+                    "The admin events of the realm can't be read: running a full sync"
+                )
+                since = None
+
+        if since is None:
+            # Changes made during the sync are synced again next time
+            mark = int(time.time() * 1000) - CLOCK_SKEW_MARGIN
+            self.full_sync()
+        else:
+            mark = self.incremental_sync(
+                since, bool(events_config.get("eventsEnabled"))
+            )
+
+        if self.dry_run:
+            self.stdout.write(
+                f"{self.created} users to create, {self.updated} users to update "
+                f"and {self.removed} users to remove"
+            )
+            return
+        mark_cache.set(SYNC_MARK_KEY, mark, timeout=None)
+        log.info(
+            "Created %d users, updated %d users and removed %d users",
+            self.created,
+            self.updated,
+            self.removed,
+        )
+
+    @staticmethod
+    def read_events_config() -> dict:
+        """
+        Returns the events configuration of the realm, or an empty
+        configuration if the service account can't read it.
+        """
+        try:
+            return get_events_config()
+        except KeycloakGetError as err:
+            log.warning("Failed to get the events configuration: %s", err)
+            return {}
+
+    @staticmethod
+    def read_superusers() -> Set[str]:
+        """
+        Returns the Keycloak ids of the admin users, or none if the service
+        account can't read them (the users are then created without admin
+        permissions).
+        """
+        try:
+            return get_superusers()
+        except KeycloakGetError as err:
+            log.warning("Failed to get the admin users: %s", err)
+            return set()
+
+    def full_sync(self) -> None:
+        """
+        Reconciles all the Keycloak users with the local users.
+        Local users created during the scan (e.g. by a login) may be
+        missing from the scanned pages, so they are never removed.
+        """
         User = get_user_model()
+        scan_start = dj_timezone.now()
 
-        remote_users = set([user.get("id") for user in lazy_keycloak_admin.get_users()])
-        local_users = set(str(_u.id) for _u in User.objects.all())
+        using = router.db_for_write(User)
+        # The remote ids are kept in the database, so that the memory used
+        # doesn't grow with the number of users
+        with SeenUsers(using) as seen_users:
+            for chunk in chunked(iter_remote_users(self.page_size), self.chunk_size):
+                seen_users.add(user["id"] for user in chunk)
+                self.reconcile(chunk)
 
-        users_to_remove = local_users.difference(remote_users)
-        users_to_add = remote_users.difference(local_users)
+            # Stream the local ids instead of loading the users
+            local_ids = (
+                User.objects.using(using)
+                .filter(date_joined__lt=scan_start)
+                .values_list(User.objects.keycloak_id_field, flat=True)
+                .order_by()
+                .iterator(chunk_size=self.chunk_size)
+            )
+            removed = []
+            for chunk in chunked(local_ids, self.chunk_size):
+                removed.extend(seen_users.unseen(chunk))
+        self.remove_users(removed)
 
-        # Delete users that are no longer in keycloak
-        User.objects.filter(id__in=list(users_to_remove)).delete()
+    def incremental_sync(self, since: int, user_events: bool) -> int:
+        """
+        Applies the changes of the Keycloak users since `since` (a UNIX
+        timestamp in milliseconds), returning the time of the last change.
+        """
+        if not user_events:
+            log.warning(
+                "The user events of the realm aren't saved: self-registered and "
+                "self-deleted users are only synced by full syncs"
+            )
+        changes, last_change = get_user_changes(since, user_events, self.page_size)
+        log.info("%d users changed since the last sync", len(changes))
 
-        log.info(
-            "Removed {} users".format(len(users_to_remove)),
-            "and there are {} new users in keycloak that are not"
-            " locally".format(len(users_to_add)),
+        self.remove_users([key for key, deleted in changes.items() if deleted])
+
+        # Reload the profiles of the changed users
+        changed_users = [key for key, deleted in changes.items() if not deleted]
+        for keycloak_id in changed_users:
+            profile_cache.delete(keycloak_id)
+        for chunk in chunked(changed_users, self.chunk_size):
+            self.reconcile(list(get_user_profiles(chunk).values()))
+        return last_change
+
+    def reconcile(self, representations: List[dict]) -> None:
+        """
+        Creates and updates the local users of a batch of Keycloak users.
+        """
+        if self.superusers is None:
+            self.superusers = self.read_superusers()
+        created, updated = get_user_model().objects.reconcile(
+            representations, dry_run=self.dry_run, superusers=self.superusers
         )
+        self.created += len(created)
+        self.updated += len(updated)
+        self.report("+", created)
+        self.report("~", updated)
+
+    def remove_users(self, keycloak_ids: List) -> None:
+        """
+        Deletes the local users with the given Keycloak ids, in chunks.
+        """
+        User = get_user_model()
+        keycloak_id_field = User.objects.keycloak_id_field
+        for chunk in chunked(keycloak_ids, self.chunk_size):
+            users = User.objects.filter(**{f"{keycloak_id_field}__in": chunk})
+            if self.dry_run:
+                self.removed += users.count()
+                self.report("-", users.only(keycloak_id_field))
+            else:
+                _, deleted = users.delete()
+                self.removed += deleted.get(User._meta.label, 0)
+
+    def report(self, change: str, users: Iterable) -> None:
+        """
+        Lists the users to change ("+" to create, "~" to update or "-" to
+        remove), in dry runs with a verbosity of 2 or more.
+        """
+        if self.dry_run and self.verbosity >= 2:
+            for user in users:
+                self.stdout.write(f"{change} {user.keycloak_identifier}")
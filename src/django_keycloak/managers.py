@@ -1,71 +1,455 @@
 """
 Module containing custom object managers
 """
+import logging
+import threading
+import uuid
+from typing import Collection, Iterable, List, Optional, Tuple
+
+import django
+from asgiref.sync import sync_to_async
+from cachetools import TTLCache
 from django.contrib.auth.models import UserManager
+from django.db import DatabaseError, connections, models, router, transaction
 
 from django_keycloak import Token
+from django_keycloak.claims import ClaimSet
+from django_keycloak.config import settings
+from django_keycloak.connector import get_user_profiles
+from django_keycloak.resolver import user_resolver
+from django_keycloak.writebehind import user_writes
+
+# Users whose profile was synced in the last `PROFILE_SYNC_INTERVAL` seconds
+recent_profile_syncs = TTLCache(
+    maxsize=settings.PROFILE_SYNC_CACHE_SIZE,
+    ttl=max(settings.PROFILE_SYNC_INTERVAL, 1),
+)
+_recent_profile_syncs_lock = threading.Lock()
+
+logger = logging.getLogger(__name__)
+
+
+def prefetch_keycloak_profiles(users: Iterable, max_workers: int = None) -> None:
+    """
+    Loads the admin API profiles of a list of users at once (see
+    `get_user_profiles`), instead of one request per user on access.
+    Only users reading their profile from Keycloak (`KeycloakUser`) are loaded.
+    """
+    # e.g. `KeycloakUserAutoId` stores the profile locally
+    users = [
+        user
+        for user in users
+        if hasattr(user, "_confirm_cache") and not user._cached_user_info
+    ]
+    if not users:
+        return
+    profiles = get_user_profiles(
+        [user.keycloak_identifier for user in users], max_workers=max_workers
+    )
+    for user in users:
+        user._cached_user_info = profiles.get(str(user.keycloak_identifier))
 
 
-class KeycloakUserManager(UserManager):
-    def create_from_token(self, token: Token, **kwargs):
+class KeycloakUserQuerySet(models.QuerySet):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefetch_profiles = False
+        self._prefetch_profiles_workers = None
+        self._profiles_prefetched = False
+
+    def prefetch_keycloak_profiles(self, max_workers: int = None):
         """
-        Create a new local database user from a valid token.
+        Returns a new QuerySet that loads the admin API profiles of its users
+        at once when evaluated, like `prefetch_related` (see
+        `prefetch_keycloak_profiles`). Ignored by `iterator()`.
         """
+        clone = self._chain()
+        clone._prefetch_profiles = True
+        clone._prefetch_profiles_workers = max_workers
+        return clone
+
+    def _clone(self, *args, **kwargs):
+        clone = super()._clone(*args, **kwargs)
+        clone._prefetch_profiles = self._prefetch_profiles
+        clone._prefetch_profiles_workers = self._prefetch_profiles_workers
+        return clone
+
+    def _fetch_all(self):
+        super()._fetch_all()
+        if self._prefetch_profiles and not self._profiles_prefetched:
+            prefetch_keycloak_profiles(
+                self._result_cache, max_workers=self._prefetch_profiles_workers
+            )
+            self._profiles_prefetched = True
+
 
-        # Get user info from token
-        user_info = token.user_info
+class KeycloakUserManager(UserManager.from_queryset(KeycloakUserQuerySet)):
+    # The model field holding the Keycloak user id
+    keycloak_id_field = "id"
+    # The model fields holding the user profile stored locally
+    profile_fields = ()
 
-        # set admin permissions if user is admin
-        if token.is_superuser:
-            is_staff = is_superuser = True
+    def create_from_token(self, token: Token, deferred: bool = False, **kwargs):
+        """
+        Create a new local database user from a valid token.
+        With `deferred`, the creation is queued in `user_writes` instead
+        when `USER_WRITE_BEHIND` is enabled.
+        """
+        user = self._build_from_claims(token.claims, token.is_superuser, **kwargs)
+        if deferred and settings.USER_WRITE_BEHIND:
+            user_writes.create(user)
         else:
-            is_staff = is_superuser = False
+            user.save(using=self._db)
+        return user
 
-        # Create the django user from the token information
-        user = self.model(
-            id=user_info.get("sub"),
-            username=user_info.get("preferred_username"),
-            is_staff=is_staff,
-            is_superuser=is_superuser,
-            **kwargs,
+    async def acreate_from_token(self, token: Token, deferred: bool = False, **kwargs):
+        """
+        Asynchronous counterpart of `create_from_token`.
+        """
+        user = self._build_from_claims(
+            await token.aclaims(), token.is_superuser, **kwargs
         )
-        user.save(using=self._db)
+        if deferred and settings.USER_WRITE_BEHIND:
+            user_writes.create(user)
+            return user
+        # `asave` is only available from Django 4.2
+        if hasattr(user, "asave"):
+            await user.asave(using=self._db)
+        else:
+            await sync_to_async(user.save)(using=self._db)
         return user
 
-    def get_by_keycloak_id(self, keycloak_id):
-        return self.get(id=keycloak_id)
+    def get_or_create_from_token(self, token: Token, deferred: bool = False, **kwargs):
+        """
+        Returns the local user of a valid token, creating it if needed.
+        The user is inserted with a single `INSERT ... ON CONFLICT`
+        statement (see `bulk_upsert`), so that concurrent first requests
+        of a new user don't fail with an `IntegrityError`.
+        With `deferred`, the creation is queued in `user_writes` instead
+        when `USER_WRITE_BEHIND` is enabled.
+        """
+        if deferred and settings.USER_WRITE_BEHIND:
+            return self.create_from_token(token, deferred=True, **kwargs)
+        claims = token.claims
+        self.bulk_upsert(
+            [self._build_from_claims(claims, token.is_superuser, **kwargs)]
+        )
+        return self.get_by_keycloak_id(claims.subject)
+
+    async def aget_or_create_from_token(
+        self, token: Token, deferred: bool = False, **kwargs
+    ):
+        """
+        Asynchronous counterpart of `get_or_create_from_token`.
+        """
+        if deferred and settings.USER_WRITE_BEHIND:
+            return await self.acreate_from_token(token, deferred=True, **kwargs)
+        claims = await token.aclaims()
+        user = self._build_from_claims(claims, token.is_superuser, **kwargs)
+        await sync_to_async(self.bulk_upsert)([user])
+        return await self.aget_by_keycloak_id(claims.subject)
 
+    def bulk_upsert(self, users: list, batch_size: Optional[int] = None) -> None:
+        """
+        Inserts unsaved users, ignoring those that already exist.
+        Where the database supports it (Django 4.1+), the profile fields
+        of existing users are updated instead.
+        """
+        profile_fields = list(self.profile_fields)
+        using = self._db or router.db_for_write(self.model)
+        features = connections[using].features
+        # `update_conflicts` is only available from Django 4.1
+        if (
+            profile_fields
+            and django.VERSION >= (4, 1)
+            and features.supports_update_conflicts
+        ):
+            unique_fields = None
+            if features.supports_update_conflicts_with_target:
+                unique_fields = [self.keycloak_id_field]
+            try:
+                # In a savepoint, to fall back inside an outer transaction
+                with transaction.atomic(using=using):
+                    self.bulk_create(
+                        users,
+                        batch_size=batch_size,
+                        update_conflicts=True,
+                        unique_fields=unique_fields,
+                        update_fields=profile_fields,
+                    )
+                return
+            except DatabaseError as err:
+                # e.g. conflicts on the username instead of the Keycloak id
+                logger.warning("Bulk upsert of users failed: %s", err)
+        self.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
 
-class KeycloakUserManagerAutoId(KeycloakUserManager):
-    def create_from_token(self, token: Token, **kwargs):
+    def reconcile(
+        self,
+        representations: List[dict],
+        dry_run: bool = False,
+        superusers: Collection[str] = (),
+    ) -> Tuple[list, list]:
         """
-        Create a local new user from a valid token
+        Creates the missing local users of a batch of Keycloak user
+        representations, and updates the profile fields that changed,
+        in a single transaction.
+        Admin permissions are given to the created users whose Keycloak id
+        is in `superusers` (existing users keep theirs, like on login).
+        Users that fail to be written (e.g. with a value too long for
+        its column) are logged and skipped.
+        Returns the created and the updated users (not saved with `dry_run`).
         """
+        representations = {str(user["id"]): user for user in representations}
+        profile_fields = list(self.profile_fields)
+        local_users = self.filter(
+            **{f"{self.keycloak_id_field}__in": list(representations)}
+        ).only(self.keycloak_id_field, *profile_fields)
 
-        user_info = token.user_info
+        updated = []
+        for user in local_users:
+            representation = representations.pop(str(user.keycloak_identifier))
+            profile = self._profile_from_representation(representation)
+            if self._apply_changes(user, profile):
+                updated.append(user)
+        created = [
+            self._build_from_representation(
+                representation, representation["id"] in superusers
+            )
+            for representation in representations.values()
+        ]
+        if dry_run or not (created or updated):
+            return created, updated
 
-        # set admin permissions if user is admin
-        if token.is_superuser:
-            is_staff = is_superuser = True
-        else:
-            is_staff = is_superuser = False
-
-        # Create the django user from the token information
-        user = self.model(
-            keycloak_id=user_info.get("sub"),
-            username=user_info.get("preferred_username"),
-            first_name=user_info.get("given_name"),
-            last_name=user_info.get("family_name"),
-            email=user_info.get("email"),
-            is_staff=is_staff,
+        using = self._db or router.db_for_write(self.model)
+        try:
+            self._write_reconciled(using, created, updated, profile_fields)
+        except DatabaseError as err:
+            logger.warning(
+                "Reconciling %d users failed: %s", len(created) + len(updated), err
+            )
+            # Write the users one by one, skipping the failing ones
+            created = [
+                user
+                for user in created
+                if self._write_reconciled(using, [user], [], profile_fields, True)
+            ]
+            updated = [
+                user
+                for user in updated
+                if self._write_reconciled(using, [], [user], profile_fields, True)
+            ]
+        # `bulk_update` doesn't send `post_save`
+        for user in updated:
+            user_resolver.invalidate(user.keycloak_identifier)
+        return created, updated
+
+    def _write_reconciled(
+        self,
+        using: str,
+        created: list,
+        updated: list,
+        profile_fields: List[str],
+        skip_errors: bool = False,
+    ) -> bool:
+        """
+        Writes reconciled users in a transaction, returning whether
+        they were written. With `skip_errors`, database errors are
+        logged instead of raised.
+        """
+        try:
+            with transaction.atomic(using=using):
+                if created:
+                    self.bulk_upsert(created)
+                if updated:
+                    self.bulk_update(updated, profile_fields)
+        except DatabaseError as err:
+            if not skip_errors:
+                raise
+            for user in [*created, *updated]:
+                logger.error("Skipped the user %s: %s", user.keycloak_identifier, err)
+            return False
+        return True
+
+    def _build_from_representation(
+        self, representation: dict, is_superuser: bool = False
+    ):
+        """
+        Builds an unsaved user from a Keycloak user representation.
+        Admin permissions are given if the user is admin.
+        """
+        return self.model(
+            **{self.keycloak_id_field: uuid.UUID(representation["id"])},
+            username=representation["username"],
+            is_staff=is_superuser,
+            is_superuser=is_superuser,
+            **self._profile_from_representation(representation),
+        )
+
+    def _profile_from_representation(self, representation: dict) -> dict:
+        """
+        Returns the profile field values stored locally, from a Keycloak
+        user representation.
+        """
+        return {}
+
+    def _build_from_claims(self, claims: ClaimSet, is_superuser: bool, **kwargs):
+        """
+        Builds an unsaved user from the token claims.
+        Admin permissions are given if the user is admin.
+        """
+        return self.model(
+            id=claims.subject,
+            username=claims.username,
+            is_staff=is_superuser,
             is_superuser=is_superuser,
             **kwargs,
         )
-        user.save(using=self._db)
-        return user
+
+    def update_from_claims(
+        self,
+        user,
+        claims: ClaimSet,
+        throttle: bool = False,
+        deferred: bool = False,
+        **kwargs,
+    ) -> bool:
+        """
+        Updates a local user with the token claims (and the given field
+        values), only writing the fields that changed.
+        Returns whether the user was saved.
+
+        Parameters
+        ----------
+        user: KeycloakUser | KeycloakUserAutoId
+            The local user.
+        claims: ClaimSet
+            The claims of the user token.
+        throttle: bool
+            Skips the update when the user profile was synced in the last
+            `PROFILE_SYNC_INTERVAL` seconds.
+        deferred: bool
+            Queues the update in `user_writes` when `USER_WRITE_BEHIND`
+            is enabled.
+        """
+        if throttle and self._recently_synced(user):
+            return False
+        fields = self._apply_changes(
+            user, {**self._profile_from_claims(claims), **kwargs}
+        )
+        if fields and deferred and settings.USER_WRITE_BEHIND:
+            user_writes.update(user, fields)
+        elif fields:
+            user.save(using=self._db, update_fields=fields)
+        return bool(fields)
+
+    async def aupdate_from_claims(
+        self,
+        user,
+        claims: ClaimSet,
+        throttle: bool = False,
+        deferred: bool = False,
+        **kwargs,
+    ) -> bool:
+        """
+        Asynchronous counterpart of `update_from_claims`.
+        """
+        if throttle and self._recently_synced(user):
+            return False
+        fields = self._apply_changes(
+            user, {**self._profile_from_claims(claims), **kwargs}
+        )
+        if fields and deferred and settings.USER_WRITE_BEHIND:
+            user_writes.update(user, fields)
+        elif fields:
+            # `asave` is only available from Django 4.2
+            if hasattr(user, "asave"):
+                await user.asave(using=self._db, update_fields=fields)
+            else:
+                await sync_to_async(user.save)(using=self._db, update_fields=fields)
+        return bool(fields)
+
+    def _profile_from_claims(self, claims: ClaimSet) -> dict:
+        """
+        Returns the profile field values stored locally, from the token claims.
+        """
+        return {}
+
+    @staticmethod
+    def _apply_changes(user, values: dict) -> List[str]:
+        """
+        Sets the values that differ from the user fields,
+        returning the names of the changed fields.
+        """
+        fields = [
+            name for name, value in values.items() if getattr(user, name) != value
+        ]
+        for name in fields:
+            setattr(user, name, values[name])
+        return fields
+
+    @staticmethod
+    def _recently_synced(user) -> bool:
+        """
+        Checks if the user profile was synced in the last `PROFILE_SYNC_INTERVAL`
+        seconds, otherwise remembers it is being synced now.
+        """
+        if not settings.PROFILE_SYNC_INTERVAL:
+            return False
+        # Users queued in `user_writes` may not have a primary key yet
+        key = getattr(user, "keycloak_identifier", user.pk)
+        with _recent_profile_syncs_lock:
+            if key in recent_profile_syncs:
+                return True
+            recent_profile_syncs[key] = True
+        return False
 
     def get_by_keycloak_id(self, keycloak_id):
         """
         Returns a local user by keycloak id
         """
-        return self.get(keycloak_id=keycloak_id)
+        return self.get(**{self.keycloak_id_field: keycloak_id})
+
+    async def aget_by_keycloak_id(self, keycloak_id):
+        """
+        Asynchronous counterpart of `get_by_keycloak_id`.
+        """
+        lookup = {self.keycloak_id_field: keycloak_id}
+        # `aget` is only available from Django 4.1
+        if hasattr(self, "aget"):
+            return await self.aget(**lookup)
+        return await sync_to_async(self.get)(**lookup)
+
+
+class KeycloakUserManagerAutoId(KeycloakUserManager):
+    keycloak_id_field = "keycloak_id"
+    profile_fields = ("first_name", "last_name", "email")
+
+    def _build_from_claims(self, claims: ClaimSet, is_superuser: bool, **kwargs):
+        """
+        Builds an unsaved user from the token claims,
+        including the profile fields stored locally.
+        """
+        return self.model(
+            keycloak_id=claims.subject,
+            username=claims.username,
+            first_name=claims.given_name,
+            last_name=claims.family_name,
+            email=claims.email,
+            is_staff=is_superuser,
+            is_superuser=is_superuser,
+            **kwargs,
+        )
+
+    def _profile_from_claims(self, claims: ClaimSet) -> dict:
+        return {
+            "first_name": claims.given_name,
+            "last_name": claims.family_name,
+            "email": claims.email,
+        }
+
+    def _profile_from_representation(self, representation: dict) -> dict:
+        return {
+            "first_name": representation.get("firstName") or "",
+            "last_name": representation.get("lastName") or "",
+            "email": representation.get("email") or "",
+        }
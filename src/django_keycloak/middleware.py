@@ -3,25 +3,98 @@ Module containing custom middleware to authenticate, create and
 sync user information between keycloak and local database.
 """
 import base64
-import re
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.utils.deprecation import MiddlewareMixin
+from django.utils.functional import SimpleLazyObject
 
-from django_keycloak import Token
+from django_keycloak import Token, async_client
+from django_keycloak.claims import ClaimSet
 from django_keycloak.config import settings
+from django_keycloak import instrumentation
+from django_keycloak.exempt import ExemptMatcher
 from django_keycloak.models import KeycloakUser, KeycloakUserAutoId
-from django_keycloak.config import settings
+from django_keycloak.resolver import user_resolver
 
 AUTH_HEADER = "HTTP_AUTHORIZATION"
 
+# The "EXEMPT_URIS" compiled once
+exempt_matcher = ExemptMatcher(
+    settings.EXEMPT_URIS or [], cache_size=settings.EXEMPT_URIS_CACHE_SIZE
+)
+
+
+class LazyAuthentication:
+    """
+    Validates the token of a request and gets its local user on first
+    access, for the `LAZY_AUTHENTICATION` mode of `KeycloakMiddleware`.
+
+    An invalid token resolves to an empty remote user and to the user
+    previously set on the request (or an anonymous user).
+    It is attached to the request as `request.keycloak_authentication`,
+    so that `KeycloakAuthentication` can share the validation.
+    """
+
+    def __init__(self, middleware: "KeycloakMiddleware", request):
+        self.middleware = middleware
+        self.request = request
+        # Don't evaluate the (lazy) user set by `AuthenticationMiddleware`
+        self.fallback_user = getattr(request, "user", None)
+        if self.fallback_user is None:
+            self.fallback_user = AnonymousUser()
+        # The validated token, once resolved
+        self.token: Optional[Token] = None
+        self._result: Optional[Tuple[dict, object]] = None
+
+    def resolve(self) -> Tuple[dict, object]:
+        """
+        Returns the remote user and the local user of the request.
+        """
+        if self._result is None:
+            token = self.middleware.get_token_from_request(self.request)
+            if token:
+                self.token = self.request.keycloak_token = token
+                claims = token.claims
+                self._result = (
+                    self.middleware.get_remote_user(claims),
+                    self.middleware.get_local_user(token, claims),
+                )
+            else:
+                self._result = ({}, self.fallback_user)
+        return self._result
+
+    async def aresolve(self) -> Tuple[dict, object]:
+        """
+        Asynchronous counterpart of `resolve`.
+        """
+        if self._result is None:
+            token = await self.middleware.aget_token_from_request(self.request)
+            if token:
+                self.token = self.request.keycloak_token = token
+                claims = await token.aclaims()
+                self._result = (
+                    self.middleware.get_remote_user(claims),
+                    await self.middleware.aget_local_user(token, claims),
+                )
+            else:
+                self._result = ({}, self.fallback_user)
+        return self._result
+
 
 class KeycloakMiddleware(MiddlewareMixin):
     """
-    Middleware to validate Keycloak access based on REST validations
+    Middleware to validate Keycloak access based on REST validations.
+
+    Under ASGI the request is processed natively async (see `__acall__`),
+    without running the authentication in a thread.
     """
 
+    sync_capable = True
+    async_capable = True
+
     def get_token_from_request(self, request) -> Optional[Token]:
         """
         Get the value of "HTTTP_AUTHORIZATION" request header.
@@ -39,16 +112,10 @@ class KeycloakMiddleware(MiddlewareMixin):
             decoded_username, decoded_password = (
                 base64.b64decode(value).decode("utf-8").split(":")
             )
-            # Try to build a Token instance from decoded credentials
-            token = Token.from_credentials(decoded_username, decoded_password)
-            if token:
-                # Convert the request "Basic" auth to token-based with access token
-                request.META[
-                    AUTH_HEADER
-                ] = f"{settings.TOKEN_PREFIX} {token.access_token}"
-            else:
-                # Setup an invalid dummy token
-                request.META[AUTH_HEADER] = f"{settings.TOKEN_PREFIX} not-valid-token"
+            # Try to build a Token instance from decoded credentials,
+            # reusing the token previously issued for them
+            token = Token.from_cached_credentials(decoded_username, decoded_password)
+            self.replace_basic_auth_header(request, token)
 
         elif auth_type == settings.TOKEN_PREFIX:
             token = Token.from_access_token(value)
@@ -57,6 +124,112 @@ class KeycloakMiddleware(MiddlewareMixin):
 
         return token
 
+    async def aget_token_from_request(self, request) -> Optional[Token]:
+        """
+        Asynchronous counterpart of `get_token_from_request`.
+        Without `httpx`, the token is validated by the synchronous
+        Keycloak client in a thread.
+        """
+        if not self.has_auth_header(request):
+            return None
+
+        if async_client.httpx is None:
+            return await sync_to_async(
+                self.get_token_from_request, thread_sensitive=False
+            )(request)
+
+        auth_type, value, *_ = request.META.get(AUTH_HEADER).split()
+
+        if auth_type == "Basic":
+            decoded_username, decoded_password = (
+                base64.b64decode(value).decode("utf-8").split(":")
+            )
+            token = await Token.afrom_cached_credentials(
+                decoded_username, decoded_password
+            )
+            self.replace_basic_auth_header(request, token)
+
+        elif auth_type == settings.TOKEN_PREFIX:
+            token = await Token.afrom_access_token(value)
+        else:
+            token = None
+
+        return token
+
+    @staticmethod
+    def replace_basic_auth_header(request, token: Optional[Token]) -> None:
+        """
+        Converts the request "Basic" auth to token-based with the access token
+        obtained from the credentials.
+        """
+        if token:
+            request.META[AUTH_HEADER] = f"{settings.TOKEN_PREFIX} {token.access_token}"
+        else:
+            # Setup an invalid dummy token
+            request.META[AUTH_HEADER] = f"{settings.TOKEN_PREFIX} not-valid-token"
+
+    @staticmethod
+    def get_remote_user(claims: ClaimSet) -> dict:
+        """
+        Returns the remote user information added to the request
+        """
+        return {
+            "client_roles": sorted(claims.client_roles),
+            "realm_roles": sorted(claims.realm_roles),
+            "client_scope": sorted(claims.scopes),
+            "name": claims.name,
+            "given_name": claims.given_name,
+            "family_name": claims.family_name,
+            "username": claims.username,
+            "email": claims.email,
+            "email_verified": claims.email_verified,
+        }
+
+    @staticmethod
+    def get_local_user(token: Token, claims: ClaimSet):
+        """
+        Returns the local user of the token, creating it or updating
+        its locally stored details
+        """
+        # Get the user model
+        User: Union[KeycloakUser, KeycloakUserAutoId] = get_user_model()  # type: ignore
+
+        # Create or update user info
+        with instrumentation.timed(instrumentation.USER_SYNC):
+            try:
+                user = user_resolver.get(claims.subject)
+                # Only writes the user details stored locally that changed,
+                # possibly in the background (see "USER_WRITE_BEHIND")
+                User.objects.update_from_claims(
+                    user, claims, throttle=True, deferred=True
+                )
+
+            except User.DoesNotExist:
+                user = User.objects.get_or_create_from_token(token, deferred=True)
+
+        return user
+
+    @staticmethod
+    async def aget_local_user(token: Token, claims: ClaimSet):
+        """
+        Asynchronous counterpart of `get_local_user`.
+        """
+        User: Union[KeycloakUser, KeycloakUserAutoId] = get_user_model()  # type: ignore
+
+        with instrumentation.timed(instrumentation.USER_SYNC):
+            try:
+                user = await user_resolver.aget(claims.subject)
+                await User.objects.aupdate_from_claims(
+                    user, claims, throttle=True, deferred=True
+                )
+
+            except User.DoesNotExist:
+                user = await User.objects.aget_or_create_from_token(
+                    token, deferred=True
+                )
+
+        return user
+
     def append_user_info_to_request(self, request, token: Token):
         """
         Appends user info to the request
@@ -65,43 +238,76 @@ class KeycloakMiddleware(MiddlewareMixin):
         if hasattr(request, "remote_user"):
             return request
 
-        user_info = token.user_info
+        claims = token.claims
 
         # add the remote user to request
-        request.remote_user = {
-            "client_roles": token.client_roles,
-            "realm_roles": token.realm_roles,
-            "client_scope": token.client_scopes,
-            "name": user_info.get("name"),
-            "given_name": user_info.get("given_name"),
-            "family_name": user_info.get("family_name"),
-            "username": user_info.get("preferred_username"),
-            "email": user_info.get("email"),
-            "email_verified": user_info.get("email_verified"),
-        }
+        request.remote_user = self.get_remote_user(claims)
 
-        # Get the user model
-        User: Union[KeycloakUser, KeycloakUserAutoId] = get_user_model()  # type: ignore
+        # Add the local user to request
+        request.user = self.get_local_user(token, claims)
 
-        # Create or update user info
-        try:
-            user = User.objects.get_by_keycloak_id(token.user_id)
+        # Share the validated token with `KeycloakAuthentication`
+        request.keycloak_token = token
 
-            # Only KeycloakUserAutoId stores the user details locally
-            if isinstance(user, KeycloakUserAutoId):
-                user.first_name = user_info.get("given_name")
-                user.last_name = user_info.get("family_name")
-                user.email = user_info.get("email")
-                user.save()
+        return request
 
-        except User.DoesNotExist:
-            user = User.objects.create_from_token(token)
+    async def aappend_user_info_to_request(self, request, token: Token):
+        """
+        Asynchronous counterpart of `append_user_info_to_request`.
+        """
+        # Check if already appended in a previous request
+        if hasattr(request, "remote_user"):
+            return request
+
+        claims = await token.aclaims()
+
+        # add the remote user to request
+        request.remote_user = self.get_remote_user(claims)
 
         # Add the local user to request
-        request.user = user
+        request.user = await self.aget_local_user(token, claims)
+
+        # Share the validated token with `KeycloakAuthentication`
+        request.keycloak_token = token
+
+        return request
+
+    def append_lazy_user_info_to_request(self, request):
+        """
+        Appends the user info to the request as lazy objects, only
+        validating the token and syncing the user on first access.
+        Async views can await `request.auser()` and `request.aremote_user()`.
+        """
+        # Check if already appended in a previous request
+        if hasattr(request, "remote_user"):
+            return request
+
+        lazy = request.keycloak_authentication = LazyAuthentication(self, request)
+
+        request.remote_user = SimpleLazyObject(lambda: lazy.resolve()[0])
+        request.user = SimpleLazyObject(lambda: lazy.resolve()[1])
+
+        async def aremote_user():
+            return (await lazy.aresolve())[0]
+
+        async def auser():
+            return (await lazy.aresolve())[1]
+
+        request.aremote_user = aremote_user
+        request.auser = auser
 
         return request
 
+    def is_lazy(self, request) -> bool:
+        """
+        Checks if the request should be authenticated lazily.
+        "Basic" auth is always authenticated eagerly, since the
+        credentials are replaced by a token in the request headers.
+        """
+        return settings.LAZY_AUTHENTICATION and not request.META[
+            AUTH_HEADER
+        ].startswith("Basic ")
+
     @staticmethod
     def has_auth_header(request) -> bool:
         """Check if exists an authentication header in the HTTP request"""
@@ -111,6 +317,9 @@ class KeycloakMiddleware(MiddlewareMixin):
         """
         To be executed before the view each request.
         """
+        if settings.SERVER_TIMING:
+            instrumentation.start_request()
+
         # Skip auth in the following cases:
         # 1. It is a URL in "EXEMPT_URIS"
         # 2. Request does not contain authorization header
@@ -118,6 +327,10 @@ class KeycloakMiddleware(MiddlewareMixin):
         if self.pass_auth(request) or not self.has_auth_header(request):
             return
 
+        if self.is_lazy(request):
+            self.append_lazy_user_info_to_request(request)
+            return
+
         token: Union[Token, None] = self.get_token_from_request(request)
 
         # If token is None, access token was not valid
@@ -125,11 +338,52 @@ class KeycloakMiddleware(MiddlewareMixin):
             # Add user info to request for a valid token
             self.append_user_info_to_request(request, token)
 
+    async def aprocess_request(self, request):
+        """
+        Asynchronous counterpart of `process_request`.
+        """
+        if settings.SERVER_TIMING:
+            instrumentation.start_request()
+
+        if self.pass_auth(request) or not self.has_auth_header(request):
+            return
+
+        if self.is_lazy(request):
+            self.append_lazy_user_info_to_request(request)
+            return
+
+        token: Union[Token, None] = await self.aget_token_from_request(request)
+
+        # If token is None, access token was not valid
+        if token:
+            # Add user info to request for a valid token
+            await self.aappend_user_info_to_request(request, token)
+
+    async def __acall__(self, request):
+        """
+        Async version of `__call__`, used by Django when the middleware
+        chain runs asynchronously.
+        """
+        await self.aprocess_request(request)
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
+    def process_response(self, request, response):
+        """
+        Adds the time spent in Keycloak calls and user syncs to the
+        `Server-Timing` header, when "SERVER_TIMING" is enabled.
+        """
+        if settings.SERVER_TIMING:
+            timings = instrumentation.end_request()
+            if timings:
+                value = instrumentation.server_timing(timings)
+                if response.has_header("Server-Timing"):
+                    value = f"{response['Server-Timing']}, {value}"
+                response["Server-Timing"] = value
+        return response
+
     def pass_auth(self, request):
         """
         Check if the current URI path needs to skip authorization
         """
-        path = request.path_info.lstrip("/")
-        exempt_uris = settings.EXEMPT_URIS
-
-        return any(re.match(m, path) for m in exempt_uris)
+        return exempt_matcher.match(request.path_info.lstrip("/"))
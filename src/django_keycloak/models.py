@@ -4,7 +4,7 @@ from django.db.models import Q
 from django.utils.translation import gettext_lazy as _
 from dry_rest_permissions.generics import authenticated_users
 
-from .connector import lazy_keycloak_admin
+from .connector import get_user_profile, lazy_keycloak_admin, profile_cache
 from .managers import KeycloakUserManager, KeycloakUserManagerAutoId
 
 
@@ -47,10 +47,25 @@ class AbstractKeycloakUser(AbstractBaseUser, PermissionsMixin):
             values["firstName"] = first_name
         if last_name is not None:
             values["lastName"] = last_name
-        return lazy_keycloak_admin.update_user(self.keycloak_identifier, **values)
+        try:
+            return lazy_keycloak_admin.update_user(
+                self.keycloak_identifier, payload=values
+            )
+        finally:
+            self._forget_profile()
 
     def delete_keycloak(self):
-        lazy_keycloak_admin.delete_user(self.keycloak_identifier)
+        try:
+            lazy_keycloak_admin.delete_user(self.keycloak_identifier)
+        finally:
+            self._forget_profile()
+
+    def _forget_profile(self):
+        """
+        Removes the user profile from the instance and from `profile_cache`.
+        """
+        self._cached_user_info = None
+        profile_cache.delete(str(self.keycloak_identifier))
 
 
 class KeycloakUser(AbstractKeycloakUser):
@@ -76,7 +91,8 @@ class KeycloakUser(AbstractKeycloakUser):
 
     def _confirm_cache(self):
         if not self._cached_user_info:
-            self._cached_user_info = lazy_keycloak_admin.get_user(self.id)
+            # Shared by all the instances of the same user
+            self._cached_user_info = get_user_profile(self.id)
 
 
 class AbstractKeycloakUserAutoId(AbstractKeycloakUser):
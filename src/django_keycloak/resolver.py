@@ -0,0 +1,80 @@
+"""
+Module to resolve local users from their Keycloak id.
+"""
+import copy
+
+from django.contrib.auth import get_user_model
+
+from django_keycloak.cache import TokenCache
+from django_keycloak.config import settings
+
+
+class UserResolver:
+    """
+    Resolves local users by Keycloak id, keeping them in a `TokenCache`
+    (in-process and, optionally, in a shared Django cache).
+
+    Each lookup returns a copy of the cached user, so that changes made
+    while handling a request are never seen by other requests.
+    Cached users are invalidated when they are saved or deleted
+    (see `invalidate_user`); users cached by other processes are
+    only refreshed after `USER_CACHE_TTL` seconds.
+    """
+
+    def __init__(self, cache: TokenCache):
+        self.cache = cache
+
+    def get(self, keycloak_id):
+        """
+        Returns the local user with the given Keycloak id.
+
+        Raises:
+            DoesNotExist: If there is no local user with that Keycloak id
+        """
+        user = self.cache.get(str(keycloak_id))
+        if user is None:
+            user = get_user_model().objects.get_by_keycloak_id(keycloak_id)
+            self.cache.set(str(keycloak_id), user)
+        return copy.copy(user)
+
+    async def aget(self, keycloak_id):
+        """
+        Asynchronous counterpart of `get`.
+        """
+        user = await self.cache.aget(str(keycloak_id))
+        if user is None:
+            user = await get_user_model().objects.aget_by_keycloak_id(keycloak_id)
+            await self.cache.aset(str(keycloak_id), user)
+        return copy.copy(user)
+
+    def set(self, keycloak_id, user) -> None:
+        """
+        Caches (a copy of) the user with the given Keycloak id.
+        """
+        self.cache.set(str(keycloak_id), copy.copy(user))
+
+    def invalidate(self, keycloak_id) -> None:
+        """
+        Removes the user with the given Keycloak id from the cache.
+        """
+        self.cache.delete(str(keycloak_id))
+
+
+# The exported resolver, used by the middleware and the DRF authentication
+user_resolver = UserResolver(
+    TokenCache(
+        maxsize=settings.USER_CACHE_SIZE,
+        ttl=settings.USER_CACHE_TTL,
+        namespace="user",
+        shared_cache=settings.USER_SHARED_CACHE,
+    )
+)
+
+
+def invalidate_user(sender, instance, **kwargs):
+    """
+    Signal receiver removing saved or deleted users from the resolver cache.
+    """
+    keycloak_id = getattr(instance, "keycloak_identifier", None)
+    if keycloak_id is not None:
+        user_resolver.invalidate(keycloak_id)
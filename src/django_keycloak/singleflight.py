@@ -0,0 +1,158 @@
+"""
+Module to coalesce concurrent Keycloak calls for the same resource.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+# Interval, in seconds, between shared cache lookups while another process
+# holds the lock
+POLL_INTERVAL = 0.05
+
+# Result of an asynchronous call whose leader was cancelled
+_ABANDONED = object()
+
+
+class _Call:
+    """
+    An in-flight call whose result is shared with the waiting threads.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """
+    Runs only one call at a time per key: concurrent callers with the
+    same key wait for the in-flight call and share its result (or error).
+
+    When `shared_cache` names a Django cache alias, calls are also
+    coordinated across processes with a lock stored in that cache.
+    Processes that don't hold the lock poll `lookup` (e.g. a shared
+    `TokenCache`) for the result until the lock is released or
+    `timeout` seconds have passed, and only then run the call themselves.
+
+    Coroutines are coalesced per event loop with `ado`, which doesn't
+    use the cross-process lock.
+    """
+
+    def __init__(self, shared_cache: Optional[str] = None, timeout: float = 5):
+        self.shared_cache = shared_cache
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._futures: Dict[Tuple[asyncio.AbstractEventLoop, str], asyncio.Future] = {}
+
+    def do(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        lookup: Optional[Callable[[], Any]] = None,
+    ) -> Any:
+        """
+        Returns the result of `fn`, sharing a single execution between
+        all concurrent callers using the same `key`.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._do_shared(key, fn, lookup)
+            return call.result
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Asynchronous counterpart of `do`: returns the result of awaiting
+        `fn()`, sharing a single execution between all concurrent
+        callers of the running event loop using the same `key`.
+        If the caller running `fn` is cancelled, a waiting caller runs
+        it instead.
+        """
+        loop = asyncio.get_running_loop()
+        future = self._futures.get((loop, key))
+        while future is not None:
+            result = await asyncio.shield(future)
+            if result is not _ABANDONED:
+                return result
+            # The leader was cancelled: the first waiter to wake up takes over
+            future = self._futures.get((loop, key))
+
+        future = self._futures[(loop, key)] = loop.create_future()
+        try:
+            result = await fn()
+        except asyncio.CancelledError:
+            # Only the leader was cancelled, not the waiters
+            future.set_result(_ABANDONED)
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            # Mark the error as retrieved, in case nobody is waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._futures[(loop, key)]
+
+    def _do_shared(
+        self,
+        key: str,
+        fn: Callable[[], Any],
+        lookup: Optional[Callable[[], Any]],
+    ) -> Any:
+        """
+        Runs `fn` holding the cross-process lock, or waits for the
+        process holding it to publish the result through `lookup`.
+        """
+        if not self.shared_cache or lookup is None:
+            return fn()
+
+        lock_key = f"django_keycloak:lock:{key}"
+        try:
+            cache = caches[self.shared_cache]
+            acquired = cache.add(lock_key, 1, timeout=max(int(self.timeout), 1))
+        except Exception as err:
+            logger.warning("Shared cache '%s' lock failed: %s", self.shared_cache, err)
+            return fn()
+
+        if acquired:
+            try:
+                return fn()
+            finally:
+                cache.delete(lock_key)
+
+        deadline = time.monotonic() + self.timeout
+        while time.monotonic() < deadline:
+            result = lookup()
+            if result is not None:
+                return result
+            if cache.get(lock_key) is None:
+                break
+            time.sleep(POLL_INTERVAL)
+        return lookup() or fn()
@@ -6,8 +6,8 @@ app = Celery()
 
 
 @app.task(queue="sync_users")
-def sync_users_with_keycloak():
+def sync_users_with_keycloak(incremental=False):
     """
     Users synchronization task
     """
-    call_command("sync_keycloak_users")
+    call_command("sync_keycloak_users", incremental=incremental)
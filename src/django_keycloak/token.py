@@ -4,10 +4,13 @@ Module to interact with the Keycloak token API
 from __future__ import annotations
 
 import logging
+import time
 from typing import Optional
 
+from asgiref.sync import sync_to_async
 from cachetools.func import ttl_cache
-from jose.exceptions import JOSEError
+from jose import jwt
+from jose.exceptions import JOSEError, JWSError, JWTError
 from keycloak.exceptions import (
     KeycloakAuthenticationError,
     KeycloakError,
@@ -15,7 +18,21 @@ from keycloak.exceptions import (
 )
 from keycloak.keycloak_openid import KeycloakOpenID
 
+from django_keycloak.async_client import AsyncKeycloakOpenID
+from django_keycloak.cache import TokenCache, credentials_digest, token_digest
+from django_keycloak.claims import ClaimSet
 from django_keycloak.config import settings
+from django_keycloak.connection import TIMEOUT, PooledConnectionManager
+from django_keycloak.instrumentation import (
+    DECODE,
+    INTROSPECT,
+    PASSWORD_GRANT,
+    REFRESH,
+    USERINFO,
+    timed,
+)
+from django_keycloak.jwks import DEFAULT_ALGORITHM, KeyStore
+from django_keycloak.singleflight import SingleFlight
 
 # Define keycloak openid instance
 KEYCLOAK = KeycloakOpenID(
@@ -24,6 +41,63 @@ KEYCLOAK = KeycloakOpenID(
     realm_name=settings.REALM,
     client_secret_key=settings.CLIENT_SECRET_KEY,
 )
+KEYCLOAK.connection = PooledConnectionManager.from_connection(KEYCLOAK.connection)
+
+# Define the asynchronous keycloak openid instance, used by the `a*` methods
+ASYNC_KEYCLOAK = AsyncKeycloakOpenID(
+    server_url=settings.KEYCLOAK_URL,
+    client_id=settings.CLIENT_ID,
+    realm_name=settings.REALM,
+    client_secret_key=settings.CLIENT_SECRET_KEY,
+    timeout=TIMEOUT,
+    max_connections=settings.HTTP_POOL_MAXSIZE,
+    keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+)
+
+# Verified token claims shared by all `Token` instances, keyed by token digest.
+# Introspection results can also be shared between workers
+claims_cache = TokenCache(
+    maxsize=settings.TOKEN_CACHE_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL,
+    namespace="claims",
+    shared_cache=None if settings.DECODE_TOKEN else settings.TOKEN_SHARED_CACHE,
+)
+
+# Realm signing keys used to decode tokens when `DECODE_TOKEN` is enabled
+key_store = KeyStore(
+    fetch=KEYCLOAK.certs, min_refresh_interval=settings.JWKS_MIN_REFRESH_INTERVAL
+)
+
+# Tokens known to be invalid, expired or revoked, keyed by token digest
+invalid_tokens_cache = TokenCache(
+    maxsize=settings.INVALID_TOKEN_CACHE_SIZE,
+    ttl=settings.INVALID_TOKEN_CACHE_TTL,
+    namespace="invalid",
+    shared_cache=None if settings.DECODE_TOKEN else settings.TOKEN_SHARED_CACHE,
+)
+
+# Userinfo endpoint responses, keyed by access token digest
+user_info_cache = TokenCache(
+    maxsize=settings.USER_INFO_CACHE_SIZE,
+    ttl=settings.USER_INFO_CACHE_TTL,
+    namespace="userinfo",
+    shared_cache=settings.TOKEN_SHARED_CACHE,
+)
+
+# Tokens issued for "Basic" auth credentials, keyed by credential digest
+credentials_cache = TokenCache(
+    maxsize=settings.BASIC_AUTH_CACHE_SIZE,
+    ttl=settings.BASIC_AUTH_CACHE_TTL,
+    namespace="credentials",
+)
+
+# Coalesces concurrent Keycloak calls made for the same token
+flights = SingleFlight(
+    shared_cache=(
+        settings.TOKEN_SHARED_CACHE if settings.SINGLE_FLIGHT_SHARED_LOCK else None
+    ),
+    timeout=settings.SINGLE_FLIGHT_TIMEOUT,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -36,13 +110,15 @@ class Token:
     ):
         self.access_token = access_token
         self.refresh_token = refresh_token
+        # The access token claims, extracted on first access
+        self._claims: Optional[ClaimSet] = None
 
     @property
     @ttl_cache(maxsize=1, ttl=60)
     def public_key(self):
         """
-        Obtains the Keycloak's Public key, used for token
-        decodings.
+        Obtains the Keycloak's Public key.
+        Token decoding uses the realm key set kept by `key_store` instead.
 
         Raises:
             KeycloakError: On Keycloak API errors
@@ -50,7 +126,6 @@ class Token:
 
         return f"-----BEGIN PUBLIC KEY-----\n{KEYCLOAK.public_key()}\n-----END PUBLIC KEY-----"
 
-    @ttl_cache(maxsize=1, ttl=60)
     def get_access_token_info(self) -> dict:
         """
         Gets the information from a token either using token decode
@@ -62,17 +137,20 @@ class Token:
         """
         if not self.access_token:
             return {}
-        # If user enabled `DECODE_TOKEN` using local decoding
-        if settings.DECODE_TOKEN:
-            return KEYCLOAK.decode_token(
-                self.access_token,
-                key=self.public_key,
-                options={"verify_aud": settings.VERIFY_AUDIENCE},
-            )
-        # Otherwise hit the Keycloak API for info
-        return KEYCLOAK.introspect(self.access_token)
+        return self._get_token_info(self.access_token)
+
+    async def aget_access_token_info(self) -> dict:
+        """
+        Asynchronous counterpart of `get_access_token_info`.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        if not self.access_token:
+            return {}
+        return await self._aget_token_info(self.access_token)
 
-    @ttl_cache(maxsize=1, ttl=60)
     def get_refresh_token_info(self) -> dict:
         """
         Gets the information from a token either using token decode
@@ -84,15 +162,101 @@ class Token:
         """
         if not self.refresh_token:
             return {}
+        return self._get_token_info(self.refresh_token)
+
+    def _get_token_info(self, token: str) -> dict:
+        """
+        Returns the verified claims of `token`, looking them up in
+        `claims_cache` before decoding or introspecting the token.
+        Only claims of active tokens are cached, and never past their `exp`.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        info = claims_cache.get(token)
+        if info is not None:
+            return info
         # If user enabled `DECODE_TOKEN` using local decoding
         if settings.DECODE_TOKEN:
+            kid, algorithm = self._get_signing_key_id(token)
+            return self._remember_claims(
+                token, self._decode(token, key_store.get_key(kid, algorithm), algorithm)
+            )
+
+        # Otherwise hit the Keycloak API for info, once for all concurrent
+        # requests with the same token
+        def introspect() -> dict:
+            with timed(INTROSPECT):
+                info = KEYCLOAK.introspect(token)
+            return self._remember_claims(token, info)
+
+        return flights.do(
+            f"introspect:{token_digest(token)}",
+            introspect,
+            lookup=lambda: claims_cache.get(token),
+        )
+
+    async def _aget_token_info(self, token: str) -> dict:
+        """
+        Asynchronous counterpart of `_get_token_info`.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        info = await claims_cache.aget(token)
+        if info is not None:
+            return info
+        if settings.DECODE_TOKEN:
+            kid, algorithm = self._get_signing_key_id(token)
+            key = await key_store.aget_key(kid, algorithm)
+            return self._remember_claims(token, self._decode(token, key, algorithm))
+
+        async def introspect() -> dict:
+            with timed(INTROSPECT):
+                info = await ASYNC_KEYCLOAK.introspect(token)
+            if info.get("active", True):
+                await claims_cache.aset(token, info, info.get("exp"))
+            return info
+
+        return await flights.ado(f"introspect:{token_digest(token)}", introspect)
+
+    @staticmethod
+    def _get_signing_key_id(token: str) -> tuple:
+        """
+        Returns the key id (`kid`) and algorithm a token was signed with.
+
+        Raises:
+            JOSEError: On malformed tokens
+        """
+        header = jwt.get_unverified_header(token)
+        return header.get("kid"), header.get("alg", DEFAULT_ALGORITHM)
+
+    @staticmethod
+    def _decode(token: str, key, algorithm: str) -> dict:
+        """
+        Decodes and verifies a token with the given realm key.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+        """
+        with timed(DECODE):
             return KEYCLOAK.decode_token(
-                self.refresh_token,
-                key=self.public_key,
+                token,
+                key=key,
+                algorithms=[algorithm],
                 options={"verify_aud": settings.VERIFY_AUDIENCE},
             )
-        # Otherwise hit the Keycloak API for info
-        return KEYCLOAK.introspect(self.refresh_token)
+
+    @staticmethod
+    def _remember_claims(token: str, info: dict) -> dict:
+        """
+        Stores the claims of an active token in `claims_cache`.
+        """
+        if info.get("active", True):
+            claims_cache.set(token, info, info.get("exp"))
+        return info
 
     @staticmethod
     def _parse_keycloak_response(keycloak_response: dict) -> dict:
@@ -110,19 +274,166 @@ class Token:
     def is_active(self) -> bool:
         """
         Returns a boolean indicating if the current access token is active or not.
+
+        Tokens known to be invalid, expired or revoked are rejected from
+        `invalid_tokens_cache` without decoding or introspecting them again.
         """
+        if self.access_token and invalid_tokens_cache.get(self.access_token):
+            return False
         try:
             info = self.get_access_token_info()
         except (JOSEError, KeycloakError) as err:
-            logger.debug(
-                "%s: %s",
-                type(err).__name__,
-                err.args,
-                exc_info=settings.TRACE_DEBUG_LOGS,
-            )
+            if self._is_invalid_token_error(err):
+                invalid_tokens_cache.set(self.access_token, True)
             return False
         # Keycloak introspections return {"active": bool}
-        return info["active"] if "active" in info else True
+        active = info["active"] if "active" in info else True
+        if not active:
+            invalid_tokens_cache.set(self.access_token, True)
+        return active
+
+    async def ais_active(self) -> bool:
+        """
+        Asynchronous counterpart of `is_active`.
+        """
+        if self.access_token and await invalid_tokens_cache.aget(self.access_token):
+            return False
+        try:
+            info = await self.aget_access_token_info()
+        except (JOSEError, KeycloakError) as err:
+            if self._is_invalid_token_error(err):
+                await invalid_tokens_cache.aset(self.access_token, True)
+            return False
+        active = info["active"] if "active" in info else True
+        if not active:
+            await invalid_tokens_cache.aset(self.access_token, True)
+        return active
+
+    @staticmethod
+    def _is_invalid_token_error(err: Exception) -> bool:
+        """
+        Logs a token validation error and returns if it proves
+        the token is invalid.
+        """
+        logger.debug(
+            "%s: %s",
+            type(err).__name__,
+            err.args,
+            exc_info=settings.TRACE_DEBUG_LOGS,
+        )
+        # Keycloak API errors (e.g. connection errors) and unknown signing
+        # keys (e.g. after a key rotation, until the key set is refreshed)
+        # don't tell if the token is invalid, so they are not remembered:
+        # only signature, expiration and claim failures are
+        return isinstance(err, (JWTError, JWSError))
+
+    @property
+    def claims(self) -> ClaimSet:
+        """
+        Returns the claims of the access token, extracted on first access.
+        The user info is fetched from Keycloak (see `user_info`) unless the
+        token includes it (i.e. DECODE_TOKEN and USER_INFO_IN_TOKEN).
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        claims = self._token_claims()
+        if claims.user_info is None:
+            claims = self._claims = claims.with_user_info(self._fetch_user_info())
+        return claims
+
+    async def aclaims(self) -> ClaimSet:
+        """
+        Asynchronous counterpart of `claims`.
+        Once awaited, the synchronous claim accessors don't make any further call.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        if self._claims is None:
+            token_info = await self.aget_access_token_info()
+            self._claims = ClaimSet.from_token_info(
+                token_info, self._user_info_in_token(token_info), settings.CLIENT_ID
+            )
+        if self._claims.user_info is None:
+            self._claims = self._claims.with_user_info(await self._afetch_user_info())
+        return self._claims
+
+    def _token_claims(self) -> ClaimSet:
+        """
+        Returns the claims of the access token, without fetching the
+        user info it doesn't include (e.g. to read the roles).
+        """
+        if self._claims is None:
+            token_info = self.get_access_token_info()
+            self._claims = ClaimSet.from_token_info(
+                token_info, self._user_info_in_token(token_info), settings.CLIENT_ID
+            )
+        return self._claims
+
+    @staticmethod
+    def _user_info_in_token(token_info: dict) -> Optional[dict]:
+        """
+        Returns the token information as user info when it includes
+        the user info, otherwise `None`.
+        """
+        if settings.DECODE_TOKEN and settings.USER_INFO_IN_TOKEN:
+            return token_info
+        return None
+
+    def _fetch_user_info(self) -> dict:
+        """
+        Gets the user information from the token, or from the Keycloak
+        userinfo endpoint when it isn't included in the token.
+        Userinfo responses are cached in `user_info_cache` until the
+        token expires at most.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        if settings.DECODE_TOKEN and settings.USER_INFO_IN_TOKEN:
+            return self.get_access_token_info()
+        info = user_info_cache.get(self.access_token)
+        if info is not None:
+            return info
+
+        def userinfo() -> dict:
+            with timed(USERINFO):
+                info = KEYCLOAK.userinfo(self.access_token)
+            user_info_cache.set(
+                self.access_token, info, self.get_access_token_info().get("exp")
+            )
+            return info
+
+        return flights.do(
+            f"userinfo:{token_digest(self.access_token)}",
+            userinfo,
+            lookup=lambda: user_info_cache.get(self.access_token),
+        )
+
+    async def _afetch_user_info(self) -> dict:
+        """
+        Asynchronous counterpart of `_fetch_user_info`.
+        """
+        if settings.DECODE_TOKEN and settings.USER_INFO_IN_TOKEN:
+            return await self.aget_access_token_info()
+        info = await user_info_cache.aget(self.access_token)
+        if info is not None:
+            return info
+
+        async def userinfo() -> dict:
+            with timed(USERINFO):
+                info = await ASYNC_KEYCLOAK.userinfo(self.access_token)
+            token_info = await self.aget_access_token_info()
+            await user_info_cache.aset(self.access_token, info, token_info.get("exp"))
+            return info
+
+        return await flights.ado(
+            f"userinfo:{token_digest(self.access_token)}", userinfo
+        )
 
     @property
     def user_info(self) -> dict:
@@ -135,9 +446,17 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        if settings.DECODE_TOKEN and settings.USER_INFO_IN_TOKEN:
-            return self.get_access_token_info()
-        return KEYCLOAK.userinfo(self.access_token)
+        return self._fetch_user_info()
+
+    async def auser_info(self) -> dict:
+        """
+        Asynchronous counterpart of `user_info`.
+
+        Raises:
+            JOSEError: On expired or invalid tokens
+            KeycloakError: On expired / invalid tokens or Keycloak API errors
+        """
+        return await self._afetch_user_info()
 
     @property
     def user_id(self) -> str:
@@ -148,7 +467,7 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        return self.user_info.get("sub")  # type: ignore
+        return self.claims.subject  # type: ignore
 
     @property
     def is_superuser(self) -> bool:
@@ -159,12 +478,10 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        if (settings.CLIENT_ADMIN_ROLE in self.client_roles) or (  # type: ignore
-            settings.REALM_ADMIN_ROLE in self.realm_roles
-        ):  # type: ignore
-            return True
-
-        return False
+        claims = self._token_claims()
+        return (settings.CLIENT_ADMIN_ROLE in claims.client_roles) or (
+            settings.REALM_ADMIN_ROLE in claims.realm_roles
+        )
 
     @property
     def client_roles(self) -> list:
@@ -175,12 +492,7 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        return (
-            self.get_access_token_info()
-            .get("resource_access", {})
-            .get(settings.CLIENT_ID, {})
-            .get("roles", [])
-        )
+        return sorted(self._token_claims().client_roles)
 
     @property
     def realm_roles(self) -> list:
@@ -191,7 +503,7 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        return self.get_access_token_info().get("realm_access", {}).get("roles", [])
+        return sorted(self._token_claims().realm_roles)
 
     @property
     def client_scopes(self) -> list:
@@ -202,7 +514,7 @@ class Token:
             JOSEError: On expired or invalid tokens
             KeycloakError: On expired / invalid tokens or Keycloak API errors
         """
-        return self.get_access_token_info().get("scope", "").split(" ")
+        return sorted(self._token_claims().scopes)
 
     @classmethod
     def from_credentials(cls, username: str, password: str) -> Optional[Token]:  # type: ignore
@@ -211,7 +523,8 @@ class Token:
         Returns `None` if authentication fails.
         """
         try:
-            keycloak_response = KEYCLOAK.token(username, password)
+            with timed(PASSWORD_GRANT):
+                keycloak_response = KEYCLOAK.token(username, password)
             return cls(**cls._parse_keycloak_response(keycloak_response))
         # Catch authentication error (invalid credentials),
         # and post error (account not completed.)
@@ -224,6 +537,154 @@ class Token:
             )
             return None
 
+    @classmethod
+    async def afrom_credentials(
+        cls, username: str, password: str
+    ) -> Optional[Token]:  # type: ignore
+        """
+        Asynchronous counterpart of `from_credentials`.
+        """
+        try:
+            with timed(PASSWORD_GRANT):
+                keycloak_response = await ASYNC_KEYCLOAK.token(username, password)
+            return cls(**cls._parse_keycloak_response(keycloak_response))
+        except (KeycloakAuthenticationError, KeycloakPostError) as err:
+            logger.debug(
+                "%s: %s",
+                type(err).__name__,
+                err.args,
+                exc_info=settings.TRACE_DEBUG_LOGS,
+            )
+            return None
+
+    @classmethod
+    def from_cached_credentials(
+        cls, username: str, password: str
+    ) -> Optional[Token]:  # type: ignore
+        """
+        Creates a `Token` object from a set of user credentials, reusing
+        the token previously issued for them until it is about to expire
+        (see `BASIC_AUTH_REFRESH_LEEWAY`), then renewing it with the
+        refresh token. Returns `None` if authentication fails.
+        """
+        digest = credentials_digest(username, password)
+        entry = credentials_cache.get(digest)
+        if cls._is_fresh(entry, "expires_at"):
+            return cls(entry["access_token"], entry["refresh_token"])
+
+        def issue() -> Optional[dict]:
+            response = None
+            authenticated_at = None
+            if cls._is_fresh(entry, "refresh_expires_at"):
+                try:
+                    with timed(REFRESH):
+                        response = KEYCLOAK.refresh_token(entry["refresh_token"])
+                    authenticated_at = entry["authenticated_at"]
+                except KeycloakError as err:
+                    logger.debug("Cached credentials refresh failed: %s", err)
+            if response is None:
+                try:
+                    with timed(PASSWORD_GRANT):
+                        response = KEYCLOAK.token(username, password)
+                except (KeycloakAuthenticationError, KeycloakPostError) as err:
+                    logger.debug(
+                        "%s: %s",
+                        type(err).__name__,
+                        err.args,
+                        exc_info=settings.TRACE_DEBUG_LOGS,
+                    )
+                    credentials_cache.delete(digest)
+                    return None
+            return cls._remember_credentials(digest, response, authenticated_at)
+
+        entry = flights.do(f"credentials:{digest}", issue)
+        return cls(entry["access_token"], entry["refresh_token"]) if entry else None
+
+    @classmethod
+    async def afrom_cached_credentials(
+        cls, username: str, password: str
+    ) -> Optional[Token]:  # type: ignore
+        """
+        Asynchronous counterpart of `from_cached_credentials`.
+        The (slow) credentials digest is computed in a thread.
+        """
+        digest = await sync_to_async(credentials_digest, thread_sensitive=False)(
+            username, password
+        )
+        entry = credentials_cache.get(digest)
+        if cls._is_fresh(entry, "expires_at"):
+            return cls(entry["access_token"], entry["refresh_token"])
+
+        async def issue() -> Optional[dict]:
+            response = None
+            authenticated_at = None
+            if cls._is_fresh(entry, "refresh_expires_at"):
+                try:
+                    with timed(REFRESH):
+                        response = await ASYNC_KEYCLOAK.refresh_token(
+                            entry["refresh_token"]
+                        )
+                    authenticated_at = entry["authenticated_at"]
+                except KeycloakError as err:
+                    logger.debug("Cached credentials refresh failed: %s", err)
+            if response is None:
+                try:
+                    with timed(PASSWORD_GRANT):
+                        response = await ASYNC_KEYCLOAK.token(username, password)
+                except (KeycloakAuthenticationError, KeycloakPostError) as err:
+                    logger.debug(
+                        "%s: %s",
+                        type(err).__name__,
+                        err.args,
+                        exc_info=settings.TRACE_DEBUG_LOGS,
+                    )
+                    credentials_cache.delete(digest)
+                    return None
+            return cls._remember_credentials(digest, response, authenticated_at)
+
+        entry = await flights.ado(f"credentials:{digest}", issue)
+        return cls(entry["access_token"], entry["refresh_token"]) if entry else None
+
+    @staticmethod
+    def _is_fresh(entry: Optional[dict], expiration: str) -> bool:
+        """
+        Checks if a cached credentials entry has a token that won't expire
+        in the next `BASIC_AUTH_REFRESH_LEEWAY` seconds.
+        """
+        if not entry or entry[expiration] is None:
+            return False
+        return entry[expiration] - settings.BASIC_AUTH_REFRESH_LEEWAY > time.time()
+
+    @staticmethod
+    def _remember_credentials(
+        digest: str, keycloak_response: dict, authenticated_at: Optional[float] = None
+    ) -> dict:
+        """
+        Caches the tokens issued for a credential digest, with their
+        expiration times. Refreshed tokens keep the time the credentials
+        were authenticated at, so that the entry still expires
+        `BASIC_AUTH_CACHE_TTL` seconds after it.
+        """
+        now = time.time()
+        expires_in = keycloak_response.get("expires_in")
+        # Keycloak returns 0 for refresh tokens that don't expire
+        refresh_expires_in = keycloak_response.get("refresh_expires_in")
+        entry = {
+            **Token._parse_keycloak_response(keycloak_response),
+            "expires_at": now + expires_in if expires_in else None,
+            "refresh_expires_at": (
+                now + refresh_expires_in if refresh_expires_in else None
+            ),
+            "authenticated_at": now if authenticated_at is None else authenticated_at,
+        }
+        if not entry["refresh_token"]:
+            entry["refresh_expires_at"] = None
+        cache_expires_at = entry["authenticated_at"] + settings.BASIC_AUTH_CACHE_TTL
+        if entry["refresh_expires_at"] is not None:
+            cache_expires_at = min(cache_expires_at, entry["refresh_expires_at"])
+        credentials_cache.set(digest, entry, cache_expires_at)
+        return entry
+
     @classmethod
     def from_access_token(cls, access_token: str) -> Optional[Token]:
         """
@@ -233,6 +694,14 @@ class Token:
         instance = cls(access_token=access_token)
         return instance if instance.is_active else None
 
+    @classmethod
+    async def afrom_access_token(cls, access_token: str) -> Optional[Token]:
+        """
+        Asynchronous counterpart of `from_access_token`.
+        """
+        instance = cls(access_token=access_token)
+        return instance if await instance.ais_active() else None
+
     @classmethod
     def from_refresh_token(cls, refresh_token: str) -> Optional[Token]:
         """
@@ -242,6 +711,15 @@ class Token:
         instance.refresh()
         return instance if instance.is_active else None
 
+    @classmethod
+    async def afrom_refresh_token(cls, refresh_token: str) -> Optional[Token]:
+        """
+        Asynchronous counterpart of `from_refresh_token`.
+        """
+        instance = cls(refresh_token=refresh_token)
+        await instance.arefresh()
+        return instance if await instance.ais_active() else None
+
     def refresh(self) -> None:
         """
         Refreshes the `access_token` with `refresh_token`.
@@ -250,8 +728,26 @@ class Token:
             KeycloakError: On Keycloak API errors
         """
         if self.refresh_token:
-            mapping = self._parse_keycloak_response(
-                KEYCLOAK.refresh_token(self.refresh_token)
-            )
+            with timed(REFRESH):
+                keycloak_response = KEYCLOAK.refresh_token(self.refresh_token)
+            mapping = self._parse_keycloak_response(keycloak_response)
+            for key, value in mapping.items():
+                setattr(self, key, value)
+            self._claims = None
+
+    async def arefresh(self) -> None:
+        """
+        Asynchronous counterpart of `refresh`.
+
+        Raises:
+            KeycloakError: On Keycloak API errors
+        """
+        if self.refresh_token:
+            with timed(REFRESH):
+                keycloak_response = await ASYNC_KEYCLOAK.refresh_token(
+                    self.refresh_token
+                )
+            mapping = self._parse_keycloak_response(keycloak_response)
             for key, value in mapping.items():
                 setattr(self, key, value)
+            self._claims = None
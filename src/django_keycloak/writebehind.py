@@ -0,0 +1,211 @@
+"""
+Module to batch the local user writes made while authenticating requests.
+"""
+import atexit
+import copy
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+
+from django_keycloak.config import settings
+from django_keycloak.resolver import user_resolver
+
+logger = logging.getLogger(__name__)
+
+
+class UserWriteQueue:
+    """
+    Write-behind queue of local user creations and profile updates.
+
+    Queued writes are merged per Keycloak id and flushed in bulk, by a
+    background timer `interval` seconds after the first queued write,
+    or as soon as `batch_size` users are queued. Queued users are put
+    in the `user_resolver` cache meanwhile, so that the requests of the
+    same process see them immediately.
+
+    Writes are no longer synchronous: a new `KeycloakUserAutoId` has no
+    primary key until it is flushed, and queued writes are lost if the
+    process is killed before flushing them. Failed writes are queued
+    again, as long as fewer than `max_size` users (by default 10 batches)
+    are queued, and retried by the next flush.
+    """
+
+    def __init__(
+        self, batch_size: int = 100, interval: float = 1, max_size: Optional[int] = None
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_size = max_size if max_size is not None else 10 * batch_size
+        self._lock = threading.Lock()
+        self._creates: Dict[str, object] = {}
+        self._updates: Dict[str, Tuple[object, Set[str]]] = {}
+        self._timer = None
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._creates) + len(self._updates)
+
+    def create(self, user) -> None:
+        """
+        Queues the creation of an unsaved user.
+        """
+        keycloak_id = str(user.keycloak_identifier)
+        with self._lock:
+            self._creates[keycloak_id] = copy.copy(user)
+            self._updates.pop(keycloak_id, None)
+            self._schedule()
+        user_resolver.set(keycloak_id, user)
+
+    def update(self, user, fields: List[str]) -> None:
+        """
+        Queues the update of some fields of a user.
+        """
+        keycloak_id = str(user.keycloak_identifier)
+        with self._lock:
+            pending = self._creates.get(keycloak_id)
+            if pending is not None:
+                # Not created yet: update the pending user instead
+                for name in fields:
+                    setattr(pending, name, getattr(user, name))
+                user = pending
+            elif user.pk is None:
+                # A copy of a user created by an earlier flush
+                self._creates[keycloak_id] = copy.copy(user)
+            else:
+                _, queued_fields = self._updates.get(keycloak_id, (None, set()))
+                self._updates[keycloak_id] = (
+                    copy.copy(user),
+                    queued_fields.union(fields),
+                )
+            self._schedule()
+        user_resolver.set(keycloak_id, user)
+
+    def _schedule(self) -> None:
+        """
+        Starts the flush timer, or flushes right away when the batch is full.
+        Must be called holding the lock.
+        """
+        full = len(self._creates) + len(self._updates) >= self.batch_size
+        if self._timer is not None and not full:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = threading.Timer(0 if full else self.interval, self._flush_later)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _flush_later(self) -> None:
+        """
+        Flushes the queue from the timer thread.
+        """
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("Failed to flush the queued user writes")
+        finally:
+            # Don't leak the database connections of the timer thread
+            connections.close_all()
+
+    def flush(self) -> None:
+        """
+        Writes all the queued user creations and updates.
+        """
+        with self._lock:
+            creates, self._creates = self._creates, {}
+            updates, self._updates = self._updates, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not creates and not updates:
+            return
+
+        User = get_user_model()
+        # The writes not done yet, queued again if one fails
+        pending_creates, pending_updates = creates, dict(updates)
+        try:
+            if creates:
+                User.objects.bulk_upsert(
+                    list(creates.values()), batch_size=self.batch_size
+                )
+            pending_creates = {}
+
+            # Users updated with the same fields are updated together
+            batches: Dict[frozenset, list] = {}
+            for user, fields in updates.values():
+                batches.setdefault(frozenset(fields), []).append(user)
+            for fields, users in batches.items():
+                User.objects.bulk_update(
+                    users, list(fields), batch_size=self.batch_size
+                )
+                for user in users:
+                    del pending_updates[str(user.keycloak_identifier)]
+        except Exception:
+            self._requeue(pending_creates, pending_updates)
+            raise
+        finally:
+            # Load the written users (with their primary key) on next access
+            for keycloak_id in [*creates, *updates]:
+                if keycloak_id in pending_creates or keycloak_id in pending_updates:
+                    continue
+                user_resolver.invalidate(keycloak_id)
+
+    def _requeue(
+        self,
+        creates: Dict[str, object],
+        updates: Dict[str, Tuple[object, Set[str]]],
+    ) -> None:
+        """
+        Queues the writes of a failed flush again, merged with the writes
+        queued meanwhile, which are newer. Writes that don't fit in
+        `max_size` queued users are dropped.
+        """
+        dropped = 0
+        with self._lock:
+            for keycloak_id, user in creates.items():
+                if keycloak_id in self._creates:
+                    continue
+                if keycloak_id in self._updates:
+                    # Apply the newer update to the creation
+                    newer, fields = self._updates.pop(keycloak_id)
+                    for name in fields:
+                        setattr(user, name, getattr(newer, name))
+                elif len(self._creates) + len(self._updates) >= self.max_size:
+                    dropped += 1
+                    continue
+                self._creates[keycloak_id] = user
+
+            for keycloak_id, (user, fields) in updates.items():
+                if keycloak_id in self._creates:
+                    continue
+                if keycloak_id in self._updates:
+                    # Keep the newer values of the fields updated again
+                    newer, newer_fields = self._updates[keycloak_id]
+                    for name in fields - newer_fields:
+                        setattr(newer, name, getattr(user, name))
+                    self._updates[keycloak_id] = (newer, fields | newer_fields)
+                elif len(self._creates) + len(self._updates) >= self.max_size:
+                    dropped += 1
+                else:
+                    self._updates[keycloak_id] = (user, fields)
+
+            if self._creates or self._updates:
+                self._schedule()
+        if dropped:
+            logger.error(
+                "Dropped %d queued user writes: the queue is full (%d users)",
+                dropped,
+                self.max_size,
+            )
+
+
+# The exported queue, used when `USER_WRITE_BEHIND` is enabled
+user_writes = UserWriteQueue(
+    batch_size=settings.USER_WRITE_BEHIND_BATCH_SIZE,
+    interval=settings.USER_WRITE_BEHIND_INTERVAL,
+)
+
+# Write the queued users on shutdown
+atexit.register(user_writes.flush)
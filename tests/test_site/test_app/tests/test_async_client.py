@@ -0,0 +1,113 @@
+import asyncio
+from unittest import mock, skipIf
+
+import requests
+from django.test import SimpleTestCase
+from django_keycloak import async_client
+from django_keycloak.async_client import AsyncKeycloakOpenID
+from keycloak.exceptions import (
+    KeycloakAuthenticationError,
+    KeycloakConnectionError,
+    KeycloakPostError,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+
+class TestAsyncKeycloakOpenID(SimpleTestCase):
+    def setUp(self):
+        self.client = AsyncKeycloakOpenID(
+            server_url="http://keycloak/",
+            realm_name="test",
+            client_id="client",
+            client_secret_key="secret",
+        )
+        self.requests = []
+
+    def mock_transport(self, handler):
+        """
+        Sends the requests of the running event loop to `handler`.
+        """
+
+        def record(request):
+            self.requests.append(request)
+            return handler(request)
+
+        self.client._clients[asyncio.get_running_loop()] = httpx.AsyncClient(
+            base_url=self.client.server_url, transport=httpx.MockTransport(record)
+        )
+
+    @skipIf(httpx is None, "httpx is not installed")
+    async def test_introspect(self):
+        self.mock_transport(lambda request: httpx.Response(200, json={"active": True}))
+
+        self.assertEqual(await self.client.introspect("token"), {"active": True})
+        request = self.requests[0]
+        self.assertEqual(
+            str(request.url),
+            "http://keycloak/realms/test/protocol/openid-connect/token/introspect",
+        )
+        self.assertIn(b"client_secret=secret", request.content)
+
+    @skipIf(httpx is None, "httpx is not installed")
+    async def test_userinfo(self):
+        self.mock_transport(lambda request: httpx.Response(200, json={"sub": "a"}))
+
+        self.assertEqual(await self.client.userinfo("token"), {"sub": "a"})
+        self.assertEqual(self.requests[0].headers["Authorization"], "Bearer token")
+
+    @skipIf(httpx is None, "httpx is not installed")
+    async def test_errors(self):
+        self.mock_transport(lambda request: httpx.Response(401, json={}))
+        with self.assertRaises(KeycloakAuthenticationError):
+            await self.client.token("user", "wrong")
+
+        self.mock_transport(lambda request: httpx.Response(400, json={}))
+        with self.assertRaises(KeycloakPostError):
+            await self.client.token("user", "incomplete")
+
+        def fail(request):
+            raise httpx.ConnectError("refused")
+
+        self.mock_transport(fail)
+        with self.assertRaises(KeycloakConnectionError):
+            await self.client.refresh_token("refresh")
+
+    @skipIf(httpx is None, "httpx is not installed")
+    async def test_clients_per_event_loop(self):
+        client = self.client.client
+        self.assertIs(self.client.client, client)
+        other_loop_client = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: asyncio.run(self._get_client())
+        )
+        self.assertIsNot(other_loop_client, client)
+
+    async def _get_client(self):
+        return self.client.client
+
+    async def test_without_httpx(self):
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'{"active": true}'
+        with mock.patch.object(async_client, "httpx", None), mock.patch.object(
+            async_client.http_session, "request", return_value=response
+        ) as request:
+            self.assertEqual(await self.client.introspect("token"), {"active": True})
+        request.assert_called_once_with(
+            "POST",
+            "http://keycloak/realms/test/protocol/openid-connect/token/introspect",
+            timeout=self.client.timeout,
+            data=mock.ANY,
+        )
+
+    async def test_connection_errors_without_httpx(self):
+        with mock.patch.object(async_client, "httpx", None), mock.patch.object(
+            async_client.http_session,
+            "request",
+            side_effect=requests.ConnectionError("refused"),
+        ):
+            with self.assertRaises(KeycloakConnectionError):
+                await self.client.userinfo("token")
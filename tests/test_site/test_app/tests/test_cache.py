@@ -0,0 +1,53 @@
+import time
+
+from django.test import SimpleTestCase
+from django_keycloak.cache import TokenCache, credentials_digest, token_digest
+
+
+class TestTokenCache(SimpleTestCase):
+    def test_hit_and_miss(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        self.assertIsNone(cache.get("token-a"))
+        cache.set("token-a", {"sub": "a"})
+        self.assertEqual(cache.get("token-a"), {"sub": "a"})
+        self.assertEqual(cache.stats["hits"], 1)
+        self.assertEqual(cache.stats["misses"], 1)
+
+    def test_entry_bounded_by_token_expiration(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        cache.set("expired", {"sub": "a"}, expires_at=time.time() - 1)
+        cache.set("expiring", {"sub": "b"}, expires_at=time.time() + 0.1)
+        self.assertIsNone(cache.get("expired"))
+        self.assertIsNotNone(cache.get("expiring"))
+        time.sleep(0.2)
+        self.assertIsNone(cache.get("expiring"))
+
+    def test_size_bound(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        for token in ("a", "b", "c"):
+            cache.set(token, token)
+        self.assertEqual(cache.stats["size"], 2)
+
+    def test_disabled(self):
+        cache = TokenCache(maxsize=0, ttl=60)
+        cache.set("token-a", {"sub": "a"})
+        self.assertIsNone(cache.get("token-a"))
+
+    def test_shared_cache(self):
+        worker_a = TokenCache(maxsize=2, ttl=60, shared_cache="default")
+        worker_b = TokenCache(maxsize=2, ttl=60, shared_cache="default")
+        worker_a.set("token-a", {"sub": "a"}, expires_at=time.time() + 60)
+        self.assertEqual(worker_b.get("token-a"), {"sub": "a"})
+        self.assertEqual(worker_b.stats["shared_hits"], 1)
+        # The shared entry is promoted into the in-process cache
+        self.assertEqual(worker_b.get("token-a"), {"sub": "a"})
+        self.assertEqual(worker_b.stats["hits"], 1)
+
+
+class TestCredentialsDigest(SimpleTestCase):
+    def test_digest(self):
+        digest = credentials_digest("user", "secret")
+        self.assertEqual(digest, credentials_digest("user", "secret"))
+        self.assertNotEqual(digest, credentials_digest("user", "secret2"))
+        # The digest is salted
+        self.assertNotEqual(digest, token_digest("user:secret"))
@@ -0,0 +1,102 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django_keycloak.config import settings
+from django_keycloak.connection import (
+    TIMEOUT,
+    PooledConnectionManager,
+    build_session,
+    http_session,
+    pool_stats,
+)
+from django_keycloak.connector import LazyKeycloakAdmin, PooledKeycloakAdmin
+from django_keycloak.token import KEYCLOAK
+from keycloak.connection import ConnectionManager
+
+
+class TestLazyKeycloakAdmin(SimpleTestCase):
+    def test_initialized_once(self):
+        calls = []
+
+        def init(admin, *args, **kwargs):
+            calls.append(kwargs)
+            time.sleep(0.05)
+            admin.realm_name = kwargs["realm_name"]
+
+        lazy = LazyKeycloakAdmin(realm_name="realm", probe=False)
+        with mock.patch.object(PooledKeycloakAdmin, "__init__", init):
+            threads = [
+                threading.Thread(target=lambda: lazy.realm_name) for _ in range(10)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(calls, [{"realm_name": "realm"}])
+        # The proxy became the admin client itself
+        self.assertIs(type(lazy), PooledKeycloakAdmin)
+        self.assertEqual(lazy.realm_name, "realm")
+
+    def test_failed_initialization_is_retried(self):
+        lazy = LazyKeycloakAdmin(realm_name="realm", probe=False)
+        with mock.patch.object(
+            PooledKeycloakAdmin, "__init__", side_effect=ConnectionError
+        ):
+            with self.assertRaises(ConnectionError):
+                lazy.realm_name
+        self.assertIs(type(lazy), LazyKeycloakAdmin)
+
+
+class OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep connections alive
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"{}")
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPooledConnection(SimpleTestCase):
+    def test_session_is_shared(self):
+        self.assertIs(KEYCLOAK.connection._s, http_session)
+        connection = PooledConnectionManager.from_connection(
+            ConnectionManager("http://keycloak/", headers={"A": "b"}, timeout=1)
+        )
+        self.assertIs(connection._s, http_session)
+        self.assertEqual(connection.base_url, "http://keycloak/")
+        self.assertEqual(connection.headers, {"A": "b"})
+        self.assertEqual(connection.timeout, TIMEOUT)
+
+    def test_pool_settings(self):
+        with mock.patch.object(settings, "HTTP_POOL_MAXSIZE", 3), mock.patch.object(
+            settings, "HTTP_MAX_RETRIES", 2
+        ):
+            session = build_session()
+        adapter = session.get_adapter("https://keycloak/")
+        self.assertEqual(adapter._pool_maxsize, 3)
+        self.assertEqual(adapter.max_retries.total, 2)
+        self.assertIn("POST", adapter.max_retries.allowed_methods)
+
+    def test_connections_are_kept_alive(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), OkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host = f"http://127.0.0.1:{server.server_port}"
+
+        connection = PooledConnectionManager(host + "/")
+        for _ in range(3):
+            self.assertEqual(connection.raw_get("realms").status_code, 200)
+
+        (stats,) = [stats for stats in pool_stats() if stats["host"] == host]
+        self.assertEqual(stats["connections"], 1)
+        self.assertEqual(stats["requests"], 3)
+        self.assertEqual(stats["idle"], 1)
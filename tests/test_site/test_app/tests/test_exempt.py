@@ -0,0 +1,42 @@
+from django.test import SimpleTestCase
+from django_keycloak.exempt import ExemptMatcher
+
+
+class TestExemptMatcher(SimpleTestCase):
+    def test_literal_prefixes(self):
+        matcher = ExemptMatcher(["health/", "metrics"])
+
+        self.assertEqual(matcher.prefixes, ("health/", "metrics"))
+        self.assertEqual(matcher.regexes, [])
+        self.assertTrue(matcher.match("health/live"))
+        self.assertTrue(matcher.match("metrics"))
+        self.assertFalse(matcher.match("api/health/"))
+
+    def test_patterns_are_combined(self):
+        matcher = ExemptMatcher([r"static/.*\.css$", r"api/v\d+/public", "docs|redoc"])
+
+        self.assertEqual(len(matcher.regexes), 1)
+        self.assertTrue(matcher.match("static/app.css"))
+        self.assertFalse(matcher.match("static/app.js"))
+        self.assertTrue(matcher.match("api/v2/public/items"))
+        self.assertTrue(matcher.match("redoc"))
+        self.assertFalse(matcher.match("api/docs"))
+
+    def test_backreferences_are_matched_separately(self):
+        matcher = ExemptMatcher([r"(a)b", r"(x)\1", r"(?i)upper"])
+
+        self.assertEqual(len(matcher.regexes), 3)
+        self.assertTrue(matcher.match("xx"))
+        self.assertFalse(matcher.match("xa"))
+        self.assertTrue(matcher.match("UPPER"))
+        self.assertFalse(matcher.match("ABC"))
+
+    def test_results_are_cached(self):
+        matcher = ExemptMatcher(["health/"], cache_size=2)
+
+        matcher.match("health/")
+        matcher.match("health/")
+        matcher.match("api/")
+
+        info = matcher.match.cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 2, 2))
@@ -0,0 +1,39 @@
+from django.test import SimpleTestCase
+from django_keycloak import instrumentation
+
+
+class TestInstrumentation(SimpleTestCase):
+    def test_request_timings(self):
+        instrumentation.start_request()
+        with instrumentation.timed(instrumentation.INTROSPECT):
+            pass
+        with instrumentation.timed(instrumentation.INTROSPECT):
+            pass
+
+        timings = instrumentation.end_request()
+        self.assertEqual(list(timings), ["introspect"])
+        self.assertEqual(timings["introspect"][0], 2)
+        self.assertRegex(
+            instrumentation.server_timing(timings),
+            r'^keycloak-introspect;dur=\d+\.\d;desc="2x"$',
+        )
+        # Nothing is recorded outside of a request
+        with instrumentation.timed(instrumentation.INTROSPECT):
+            pass
+        self.assertEqual(instrumentation.end_request(), {})
+
+    def test_signal(self):
+        received = []
+
+        def receiver(sender, duration, error, **kwargs):
+            received.append((sender, error))
+
+        instrumentation.keycloak_operation.connect(receiver)
+        self.addCleanup(instrumentation.keycloak_operation.disconnect, receiver)
+
+        error = ValueError("boom")
+        with self.assertRaises(ValueError):
+            with instrumentation.timed(instrumentation.USERINFO):
+                raise error
+
+        self.assertEqual(received, [("userinfo", error)])
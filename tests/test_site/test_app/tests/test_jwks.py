@@ -0,0 +1,64 @@
+import base64
+import time
+
+from django.test import SimpleTestCase
+from django_keycloak.jwks import KeyStore
+from jose.exceptions import JWKError
+
+
+def oct_key(kid: str) -> dict:
+    secret = base64.urlsafe_b64encode(kid.encode() * 32).rstrip(b"=").decode()
+    return {"kty": "oct", "kid": kid, "alg": "HS256", "use": "sig", "k": secret}
+
+
+class TestKeyStore(SimpleTestCase):
+    def setUp(self):
+        self.key_set = {"keys": [oct_key("a")]}
+        self.fetches = 0
+
+        def fetch():
+            self.fetches += 1
+            return self.key_set
+
+        self.key_store = KeyStore(fetch=fetch, min_refresh_interval=60)
+
+    def test_keys_are_fetched_once(self):
+        self.key_store.get_key("a", "HS256")
+        self.key_store.get_key("a", "HS256")
+        self.assertEqual(self.fetches, 1)
+
+    def test_unknown_kid_refreshes_keys(self):
+        self.key_store.get_key("a", "HS256")
+        self.key_store._last_refresh = time.monotonic() - 61
+        self.key_set = {"keys": [oct_key("a"), oct_key("b")]}
+
+        self.assertIsNotNone(self.key_store.get_key("b", "HS256"))
+        self.assertEqual(self.fetches, 2)
+
+    def test_refreshes_are_rate_limited(self):
+        self.key_store.get_key("a", "HS256")
+        for _ in range(3):
+            with self.assertRaises(JWKError):
+                self.key_store.get_key("unknown", "HS256")
+        self.assertEqual(self.fetches, 1)
+
+    def test_key_rotation(self):
+        self.key_store.get_key("a", "HS256")
+        self.key_set = {"keys": [oct_key("b")]}
+
+        # Within the rate limit, the new key isn't known yet
+        with self.assertRaises(JWKError):
+            self.key_store.get_key("b", "HS256")
+
+        self.key_store._last_refresh = time.monotonic() - 61
+        self.assertIsNotNone(self.key_store.get_key("b", "HS256"))
+        # Rotated out keys are forgotten
+        with self.assertRaises(JWKError):
+            self.key_store.get_key("a", "HS256")
+        self.assertEqual(self.fetches, 2)
+
+    def test_keys_not_meant_for_signatures_are_skipped(self):
+        self.key_set = {"keys": [{**oct_key("enc"), "use": "enc"}, oct_key("a")]}
+        with self.assertRaises(JWKError):
+            self.key_store.get_key("enc", "HS256")
+        self.assertIsNotNone(self.key_store.get_key("a", "HS256"))
@@ -0,0 +1,141 @@
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DataError
+from django.test import TestCase
+from django_keycloak import managers
+from django_keycloak.claims import ClaimSet
+
+
+class TestUpdateFromClaims(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create(id=uuid.uuid4(), username="bob")
+        self.claims = ClaimSet.from_token_info({}, {"sub": str(self.user.id)}, "c")
+
+    def test_unchanged_user_is_not_saved(self):
+        with mock.patch.object(self.user, "save") as save:
+            saved = get_user_model().objects.update_from_claims(
+                self.user, self.claims, is_staff=False
+            )
+
+        self.assertFalse(saved)
+        save.assert_not_called()
+
+    def test_only_changed_fields_are_saved(self):
+        with mock.patch.object(self.user, "save") as save:
+            saved = get_user_model().objects.update_from_claims(
+                self.user, self.claims, is_staff=True, is_superuser=False
+            )
+
+        self.assertTrue(saved)
+        save.assert_called_once_with(using=mock.ANY, update_fields=["is_staff"])
+        self.assertTrue(self.user.is_staff)
+
+    def test_throttled_syncs_are_skipped(self):
+        managers.recent_profile_syncs.clear()
+        objects = get_user_model().objects
+        with mock.patch.object(managers.settings, "PROFILE_SYNC_INTERVAL", 60):
+            self.assertTrue(
+                objects.update_from_claims(
+                    self.user, self.claims, throttle=True, is_staff=True
+                )
+            )
+            self.assertFalse(
+                objects.update_from_claims(
+                    self.user, self.claims, throttle=True, is_staff=False
+                )
+            )
+        self.assertTrue(get_user_model().objects.get(id=self.user.id).is_staff)
+
+
+class TestGetOrCreateFromToken(TestCase):
+    def test_existing_user_is_returned(self):
+        User = get_user_model()
+        user = User.objects.create(id=uuid.uuid4(), username="bob")
+        token = mock.Mock(
+            claims=ClaimSet.from_token_info(
+                {}, {"sub": str(user.id), "preferred_username": "bob"}, "c"
+            ),
+            is_superuser=False,
+        )
+
+        # A concurrent request created the user first: no IntegrityError
+        self.assertEqual(User.objects.get_or_create_from_token(token), user)
+        self.assertEqual(User.objects.count(), 1)
+
+    def test_new_user_is_created(self):
+        User = get_user_model()
+        keycloak_id = uuid.uuid4()
+        token = mock.Mock(
+            claims=ClaimSet.from_token_info(
+                {}, {"sub": str(keycloak_id), "preferred_username": "alice"}, "c"
+            ),
+            is_superuser=True,
+        )
+
+        user = User.objects.get_or_create_from_token(token)
+
+        self.assertEqual((user.id, user.username), (keycloak_id, "alice"))
+        self.assertTrue(user.is_superuser)
+
+
+class TestReconcile(TestCase):
+    def test_missing_users_are_created(self):
+        User = get_user_model()
+        existing = User.objects.create(id=uuid.uuid4(), username="bob")
+        new_id = uuid.uuid4()
+        representations = [
+            {"id": str(existing.id), "username": "bob"},
+            {"id": str(new_id), "username": "alice"},
+        ]
+
+        created, updated = User.objects.reconcile(representations, dry_run=True)
+        self.assertEqual([user.id for user in created], [new_id])
+        self.assertFalse(User.objects.filter(id=new_id).exists())
+
+        created, updated = User.objects.reconcile(representations)
+        self.assertEqual(len(created), 1)
+        self.assertEqual(updated, [])
+        self.assertEqual(User.objects.get(id=new_id).username, "alice")
+
+    def test_admin_users_are_created_with_admin_permissions(self):
+        User = get_user_model()
+        admin_id, user_id = str(uuid.uuid4()), str(uuid.uuid4())
+        User.objects.reconcile(
+            [
+                {"id": admin_id, "username": "admin"},
+                {"id": user_id, "username": "user"},
+            ],
+            superusers={admin_id},
+        )
+
+        admin = User.objects.get(id=admin_id)
+        self.assertTrue(admin.is_staff and admin.is_superuser)
+        user = User.objects.get(id=user_id)
+        self.assertFalse(user.is_staff or user.is_superuser)
+
+    def test_failing_users_are_skipped(self):
+        User = get_user_model()
+        good_id, bad_id = uuid.uuid4(), uuid.uuid4()
+        bulk_upsert = User.objects.bulk_upsert
+
+        def upsert(users, *args, **kwargs):
+            if any(user.id == bad_id for user in users):
+                raise DataError("value too long")
+            return bulk_upsert(users, *args, **kwargs)
+
+        with mock.patch.object(
+            User.objects, "bulk_upsert", side_effect=upsert
+        ), self.assertLogs(managers.logger, "ERROR") as logs:
+            created, _ = User.objects.reconcile(
+                [
+                    {"id": str(good_id), "username": "good"},
+                    {"id": str(bad_id), "username": "bad"},
+                ]
+            )
+
+        self.assertEqual([user.id for user in created], [good_id])
+        self.assertTrue(User.objects.filter(id=good_id).exists())
+        self.assertFalse(User.objects.filter(id=bad_id).exists())
+        self.assertIn(str(bad_id), logs.output[-1])
@@ -1,7 +1,26 @@
-from django.test import TestCase
+import json
+import time
+import uuid
+from unittest import mock
+
+import requests
+from django.http import HttpResponse
+from django.contrib.auth.models import AnonymousUser
+from django.test import AsyncRequestFactory, RequestFactory, SimpleTestCase, TestCase
 from django.urls import reverse
+from django_keycloak import Token, async_client
+from django_keycloak.authentication import (
+    AsyncKeycloakAuthentication,
+    KeycloakAuthentication,
+)
+from django_keycloak.config import settings
+from django_keycloak.connection import http_session
 from django_keycloak.connector import lazy_keycloak_admin
+from django_keycloak.middleware import KeycloakMiddleware, LazyAuthentication
 from django_keycloak.mixins import KeycloakTestMixin
+from django_keycloak.token import claims_cache, user_info_cache
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.request import Request
 
 
 class TestMiddleware(KeycloakTestMixin, TestCase):
@@ -35,8 +54,119 @@ class TestMiddleware(KeycloakTestMixin, TestCase):
         self.assertDictContainsSubset(data, self.keycloak_user)
 
 
+@mock.patch.object(settings, "LAZY_AUTHENTICATION", True)
+class TestLazyMiddleware(TestMiddleware):
+    def test_invalid_auth_token(self):
+        header = {"HTTP_AUTHORIZATION": "Bearer DummyJWT"}
+        response = self.client.get(reverse("test_app:who_am_i"), **header)
+        self.assertTrue(response.json()["isAnonymous"])
+
+
 class TestErrorHandling(TestCase):
     def test_invalid_auth_token(self):
         header = {"HTTP_AUTHORIZATION": "Bearer DummyJWT"}
         response = self.client.get(reverse("test_app:who_am_i"), **header)
         self.assertTrue(response.json()["isAnonymous"])
+
+
+@mock.patch.object(async_client, "httpx", None)
+@mock.patch.object(settings, "DECODE_TOKEN", False)
+class TestAsyncMiddlewareWithoutHttpx(TestCase):
+    def setUp(self):
+        claims_cache.clear()
+        user_info_cache.clear()
+        self.keycloak_id = str(uuid.uuid4())
+        self.urls = []
+
+    def keycloak_response(self, method, url, **kwargs):
+        self.urls.append(url)
+        if url.endswith("/introspect"):
+            body = {
+                "active": True,
+                "sub": self.keycloak_id,
+                "exp": int(time.time()) + 300,
+            }
+        else:
+            body = {"sub": self.keycloak_id, "preferred_username": "asgi-user"}
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps(body).encode()
+        return response
+
+    async def test_user_auth(self):
+        async def get_response(request):
+            return HttpResponse(request.user.username)
+
+        middleware = KeycloakMiddleware(get_response)
+        request = AsyncRequestFactory().get("/")
+        request.META["HTTP_AUTHORIZATION"] = "Bearer opaque-token"
+        with mock.patch.object(
+            http_session, "request", side_effect=self.keycloak_response
+        ):
+            response = await middleware(request)
+
+        self.assertEqual(response.content, b"asgi-user")
+        self.assertEqual(str(request.user.keycloak_identifier), self.keycloak_id)
+        self.assertTrue(any(url.endswith("/introspect") for url in self.urls))
+
+
+class TestSharedAuthentication(SimpleTestCase):
+    """
+    `KeycloakAuthentication` reuses the token validated by the middleware.
+    """
+
+    def setUp(self):
+        self.token = Token(access_token="validated")
+        self.user = AnonymousUser()
+        patcher = mock.patch.object(
+            Token, "from_access_token", side_effect=AssertionError("validated again")
+        )
+        self.from_access_token = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def request(self, access_token="validated"):
+        return RequestFactory().get(
+            "/", HTTP_AUTHORIZATION=f"{settings.TOKEN_PREFIX} {access_token}"
+        )
+
+    def test_middleware_token_is_reused(self):
+        request = self.request()
+        request.keycloak_token, request.user = self.token, self.user
+        self.assertEqual(
+            KeycloakAuthentication().authenticate(Request(request)),
+            (self.user, "validated"),
+        )
+
+    def test_other_token_is_validated(self):
+        request = self.request("other")
+        request.keycloak_token, request.user = self.token, self.user
+        self.from_access_token.side_effect = None
+        self.from_access_token.return_value = None
+        with self.assertRaises(AuthenticationFailed):
+            KeycloakAuthentication().authenticate(Request(request))
+        self.from_access_token.assert_called_once_with("other")
+
+    def test_lazy_authentication_is_shared(self):
+        request = self.request()
+        middleware = KeycloakMiddleware(lambda request: None)
+        request.keycloak_authentication = LazyAuthentication(middleware, request)
+        with mock.patch.object(
+            middleware, "get_token_from_request", return_value=self.token
+        ) as get_token, mock.patch.object(
+            Token, "claims", new_callable=mock.PropertyMock
+        ), mock.patch.object(
+            middleware, "get_local_user", return_value=self.user
+        ):
+            result = KeycloakAuthentication().authenticate(Request(request))
+            # The middleware resolves the same validation
+            request.keycloak_authentication.resolve()
+        self.assertEqual(result, (self.user, "validated"))
+        get_token.assert_called_once()
+
+    async def test_async_authentication(self):
+        request = self.request()
+        request.keycloak_token, request.user = self.token, self.user
+        self.assertEqual(
+            await AsyncKeycloakAuthentication().authenticate(Request(request)),
+            (self.user, "validated"),
+        )
@@ -0,0 +1,137 @@
+import uuid
+from unittest import mock
+
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from keycloak.exceptions import KeycloakGetError
+
+from django_keycloak import managers
+from django_keycloak.api.serializers import KeycloakUserAutoIdSerializer
+from django_keycloak.connector import get_user_profiles, profile_cache
+
+
+class TestProfileCache(SimpleTestCase):
+    def setUp(self):
+        profile_cache.clear()
+        self.keycloak_id = uuid.uuid4()
+        # Replace the lazy admin client without connecting it
+        self.admin = mock.MagicMock()
+        for module in ("django_keycloak.connector", "django_keycloak.models"):
+            patcher = mock.patch(f"{module}.lazy_keycloak_admin", new=self.admin)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_profile_is_shared_between_instances(self):
+        admin = self.admin
+        admin.get_user.return_value = {"email": "bob@example.com"}
+        User = get_user_model()
+
+        self.assertEqual(User(id=self.keycloak_id).email, "bob@example.com")
+        self.assertEqual(User(id=self.keycloak_id).email, "bob@example.com")
+
+        admin.get_user.assert_called_once_with(self.keycloak_id)
+
+    def test_update_invalidates_profile(self):
+        admin = self.admin
+        admin.get_user.return_value = {"firstName": "Bob"}
+        user = get_user_model()(id=self.keycloak_id)
+        self.assertEqual(user.first_name, "Bob")
+
+        admin.get_user.return_value = {"firstName": "Robert"}
+        user.update_keycloak(first_name="Robert")
+
+        admin.update_user.assert_called_once_with(
+            self.keycloak_id, payload={"firstName": "Robert"}
+        )
+        self.assertEqual(get_user_model()(id=self.keycloak_id).first_name, "Robert")
+        self.assertEqual(user.first_name, "Robert")
+
+
+class TestPrefetchProfiles(TestCase):
+    def setUp(self):
+        profile_cache.clear()
+        self.admin = mock.MagicMock()
+        self.admin.get_user.side_effect = lambda keycloak_id: {
+            "email": f"{keycloak_id}@example.com"
+        }
+        for module in ("django_keycloak.connector", "django_keycloak.models"):
+            patcher = mock.patch(f"{module}.lazy_keycloak_admin", new=self.admin)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        User = get_user_model()
+        self.users = [
+            User.objects.create(id=uuid.uuid4(), username=f"user{index}")
+            for index in range(5)
+        ]
+
+    def test_queryset_prefetches_profiles(self):
+        users = list(
+            get_user_model()
+            .objects.order_by("username")
+            .prefetch_keycloak_profiles()[:3]
+        )
+        self.assertEqual(self.admin.get_user.call_count, 3)
+
+        self.assertEqual(
+            [user.email for user in users],
+            [f"{user.id}@example.com" for user in self.users[:3]],
+        )
+        self.assertEqual(self.admin.get_user.call_count, 3)
+
+    def test_failed_profiles_are_fetched_on_access(self):
+        failing = str(self.users[0].id)
+
+        def get_user(keycloak_id):
+            if str(keycloak_id) == failing:
+                raise KeycloakGetError("Not found", response_code=404)
+            return {"email": f"{keycloak_id}@example.com"}
+
+        self.admin.get_user.side_effect = get_user
+        users = {
+            str(user.id): user
+            for user in get_user_model().objects.prefetch_keycloak_profiles()
+        }
+
+        self.assertIsNone(users[failing]._cached_user_info)
+        self.assertEqual(self.admin.get_user.call_count, 5)
+        with self.assertRaises(KeycloakGetError):
+            users[failing].email
+
+    def changelist(self, list_display):
+        model_admin = admin.site._registry[get_user_model()]
+        request = RequestFactory().get("/admin/")
+        request.user = get_user_model()(
+            id=uuid.uuid4(), is_active=True, is_staff=True, is_superuser=True
+        )
+        with mock.patch.object(model_admin, "list_display", list_display):
+            return model_admin.changelist_view(request).render()
+
+    def test_admin_change_list_prefetches_profiles(self):
+        with mock.patch.object(
+            managers, "get_user_profiles", wraps=get_user_profiles
+        ) as prefetch:
+            response = self.changelist(("id", "username", "email"))
+
+        prefetch.assert_called_once()
+        self.assertEqual(
+            set(prefetch.call_args[0][0]), {user.id for user in self.users}
+        )
+        self.assertEqual(self.admin.get_user.call_count, 5)
+        self.assertContains(response, f"{self.users[0].id}@example.com")
+
+    def test_admin_change_list_without_profile_fields(self):
+        self.changelist(("id", "username"))
+        self.admin.get_user.assert_not_called()
+
+    def test_list_serializer_prefetches_profiles(self):
+        with mock.patch.object(
+            managers, "get_user_profiles", wraps=get_user_profiles
+        ) as prefetch:
+            data = KeycloakUserAutoIdSerializer(
+                get_user_model().objects.order_by("username"), many=True
+            ).data
+
+        prefetch.assert_called_once()
+        self.assertEqual(self.admin.get_user.call_count, 5)
+        self.assertEqual(data[0]["email"], f"{self.users[0].id}@example.com")
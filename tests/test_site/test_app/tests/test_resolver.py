@@ -0,0 +1,40 @@
+import uuid
+
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+from django_keycloak.resolver import user_resolver
+
+
+class TestUserResolver(TestCase):
+    def setUp(self):
+        user_resolver.cache.clear()
+        self.user = get_user_model().objects.create(id=uuid.uuid4(), username="bob")
+
+    def test_cached_user_costs_no_queries(self):
+        user_resolver.get(self.user.id)
+
+        with self.assertNumQueries(0):
+            user = user_resolver.get(self.user.id)
+
+        self.assertEqual(user, self.user)
+
+    def test_copies_are_returned(self):
+        user = user_resolver.get(self.user.id)
+        user.is_staff = True
+
+        self.assertFalse(user_resolver.get(self.user.id).is_staff)
+
+    def test_saved_user_is_invalidated(self):
+        user_resolver.get(self.user.id)
+        self.user.is_staff = True
+        self.user.save()
+
+        with self.assertNumQueries(1):
+            self.assertTrue(user_resolver.get(self.user.id).is_staff)
+
+    def test_deleted_user_is_invalidated(self):
+        user_resolver.get(self.user.id)
+        self.user.delete()
+
+        with self.assertRaises(get_user_model().DoesNotExist):
+            user_resolver.get(self.user.id)
@@ -0,0 +1,83 @@
+import asyncio
+import threading
+import time
+
+from django.test import SimpleTestCase
+from django_keycloak.singleflight import SingleFlight
+
+
+class TestSingleFlight(SimpleTestCase):
+    def test_concurrent_calls_are_coalesced(self):
+        flights = SingleFlight()
+        calls = []
+
+        def introspect():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"active": True}
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(flights.do("k", introspect)))
+            for _ in range(10)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"active": True}] * 10)
+
+    def test_errors_are_shared(self):
+        flights = SingleFlight()
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flights.do("k", fail)
+        # A failed call is not remembered
+        self.assertEqual(flights.do("k", lambda: 1), 1)
+
+    def test_shared_lock(self):
+        flights = SingleFlight(shared_cache="default", timeout=1)
+        self.assertEqual(flights.do("k", lambda: 1, lookup=lambda: None), 1)
+
+    async def test_concurrent_coroutines_are_coalesced(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def introspect():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"active": True}
+
+        results = await asyncio.gather(
+            *(flights.ado("k", introspect) for _ in range(10))
+        )
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"active": True}] * 10)
+
+    async def test_cancelled_leader_hands_over(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def introspect():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            return {"active": True}
+
+        leader = asyncio.ensure_future(flights.ado("k", introspect))
+        await asyncio.sleep(0)
+        waiters = [
+            asyncio.ensure_future(flights.ado("k", introspect)) for _ in range(3)
+        ]
+        await asyncio.sleep(0)
+        leader.cancel()
+
+        # The waiters didn't cancel anything: one of them calls again
+        self.assertEqual(await asyncio.gather(*waiters), [{"active": True}] * 3)
+        self.assertTrue(leader.cancelled())
+        self.assertEqual(len(calls), 2)
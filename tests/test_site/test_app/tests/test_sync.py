@@ -0,0 +1,257 @@
+import io
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import TestCase
+from django_keycloak.config import settings
+from django_keycloak.connector import profile_cache
+from django_keycloak.management.commands.sync_keycloak_users import (
+    SYNC_MARK_KEY,
+    iter_events,
+)
+
+
+class TestSyncKeycloakUsers(TestCase):
+    def setUp(self):
+        self.admin = mock.MagicMock()
+        patcher = mock.patch(
+            "django_keycloak.management.commands.sync_keycloak_users"
+            ".lazy_keycloak_admin",
+            new=self.admin,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            "django_keycloak.connector.lazy_keycloak_admin", new=self.admin
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        profile_cache.clear()
+
+        User = get_user_model()
+        self.users = [
+            User.objects.create(id=uuid.uuid4(), username=f"user{index}")
+            for index in range(5)
+        ]
+
+    def set_remote_users(self, ids):
+        users = [
+            {"id": str(keycloak_id), "username": f"remote{index}"}
+            for index, keycloak_id in enumerate(ids)
+        ]
+        self.admin.get_users.side_effect = lambda query: users[
+            query["first"] : query["first"] + query["max"]
+        ]
+
+    def test_reconciles_local_users(self):
+        new_user = uuid.uuid4()
+        self.set_remote_users(
+            [self.users[0].id, self.users[2].id, self.users[4].id, new_user]
+        )
+
+        call_command("sync_keycloak_users", page_size=2, chunk_size=1)
+
+        self.assertQuerysetEqual(
+            get_user_model().objects.order_by("username"),
+            [new_user, self.users[0].id, self.users[2].id, self.users[4].id],
+            transform=lambda user: user.id,
+        )
+        self.assertEqual(get_user_model().objects.get(id=new_user).username, "remote3")
+
+    def test_keeps_users_created_during_the_sync(self):
+        self.set_remote_users([user.id for user in self.users])
+        get_page = self.admin.get_users.side_effect
+        logged_in = uuid.uuid4()
+
+        def get_users(query):
+            # A new Keycloak user logs in after the first page was read
+            if query["first"] == 2:
+                get_user_model().objects.create(id=logged_in, username="new")
+            return get_page(query)
+
+        self.admin.get_users.side_effect = get_users
+
+        call_command("sync_keycloak_users", page_size=2)
+
+        self.assertTrue(get_user_model().objects.filter(id=logged_in).exists())
+        self.assertEqual(get_user_model().objects.count(), 6)
+
+    def test_admin_users_are_created_with_admin_permissions(self):
+        realm_admin, client_admin, user = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        self.set_remote_users([realm_admin, client_admin, user])
+        self.admin.get_realm_role_members.return_value = [{"id": str(realm_admin)}]
+        self.admin.get_client_id.return_value = "client-uuid"
+        self.admin.get_client_role_members.return_value = [{"id": str(client_admin)}]
+
+        call_command("sync_keycloak_users")
+
+        self.assertEqual(
+            set(
+                get_user_model()
+                .objects.filter(is_superuser=True, is_staff=True)
+                .values_list("id", flat=True)
+            ),
+            {realm_admin, client_admin},
+        )
+        self.admin.get_client_role_members.assert_called_once_with(
+            "client-uuid", settings.CLIENT_ADMIN_ROLE
+        )
+
+    def test_seen_users_table_is_dropped(self):
+        self.set_remote_users([user.id for user in self.users[1:]])
+
+        call_command("sync_keycloak_users", chunk_size=2)
+        self.set_remote_users([user.id for user in self.users[2:]])
+        call_command("sync_keycloak_users", chunk_size=2)
+
+        self.assertEqual(get_user_model().objects.count(), 3)
+
+    def test_dry_run_reports_changes(self):
+        new_user = uuid.uuid4()
+        self.set_remote_users([user.id for user in self.users[1:]] + [new_user])
+        out = io.StringIO()
+
+        call_command("sync_keycloak_users", dry_run=True, verbosity=2, stdout=out)
+
+        self.assertEqual(
+            out.getvalue().splitlines(),
+            [
+                f"+ {new_user}",
+                f"- {self.users[0].id}",
+                "1 users to create, 0 users to update and 1 users to remove",
+            ],
+        )
+        self.assertEqual(get_user_model().objects.count(), 5)
+
+    def test_fetches_keycloak_users_page_by_page(self):
+        self.set_remote_users([user.id for user in self.users])
+
+        call_command("sync_keycloak_users", page_size=2)
+
+        self.assertEqual(
+            [call.args[0]["first"] for call in self.admin.get_users.call_args_list],
+            [0, 2, 4],
+        )
+        self.assertEqual(get_user_model().objects.count(), 5)
+
+
+class TestIncrementalSync(TestSyncKeycloakUsers):
+    def setUp(self):
+        super().setUp()
+        caches["default"].delete(SYNC_MARK_KEY)
+        self.addCleanup(caches["default"].delete, SYNC_MARK_KEY)
+        self.admin.realm_name = "test"
+        self.events_config = {"adminEventsEnabled": True, "eventsEnabled": True}
+        self.admin_events = []
+        self.admin.get_events.return_value = []
+        self.admin.get_user.side_effect = lambda keycloak_id: {
+            "id": keycloak_id,
+            "username": f"remote-{keycloak_id}",
+        }
+
+        def raw_get(url, **query):
+            if url.endswith("/events/config"):
+                data = self.events_config
+            else:
+                data = self.admin_events[query["first"] : query["first"] + query["max"]]
+            return mock.MagicMock(status_code=200, json=lambda: data)
+
+        self.admin.raw_get.side_effect = raw_get
+
+    def test_first_incremental_sync_is_full(self):
+        self.set_remote_users([user.id for user in self.users[1:]])
+
+        with self.assertLogs(level="WARNING") as logs:
+            call_command("sync_keycloak_users", incremental=True)
+        # The test cache is process-local
+        self.assertIn("is process-local", logs.output[0])
+
+        self.assertEqual(get_user_model().objects.count(), 4)
+        self.assertIsNotNone(caches["default"].get(SYNC_MARK_KEY))
+
+    def test_applies_changes_since_last_sync(self):
+        caches["default"].set(SYNC_MARK_KEY, 1000)
+        deleted, updated, created = self.users[0].id, self.users[1].id, uuid.uuid4()
+        self.admin_events = [
+            {
+                "time": 3000,
+                "operationType": "DELETE",
+                "resourcePath": f"users/{deleted}",
+            },
+            {
+                "time": 2000,
+                "operationType": "ACTION",
+                "resourcePath": f"users/{updated}/reset-password",
+            },
+            {
+                "time": 500,
+                "operationType": "DELETE",
+                "resourcePath": f"users/{self.users[2].id}",
+            },
+        ]
+        user_events = [
+            {"time": 4000, "type": "DELETE_ACCOUNT", "userId": str(self.users[3].id)},
+            {"time": 1500, "type": "REGISTER", "userId": str(created)},
+        ]
+        self.admin.get_events.side_effect = lambda query: user_events[
+            query["first"] : query["first"] + query["max"]
+        ]
+
+        call_command("sync_keycloak_users", incremental=True, page_size=2)
+
+        self.admin.get_users.assert_not_called()
+        self.assertQuerysetEqual(
+            get_user_model().objects.order_by("username"),
+            [created, self.users[1].id, self.users[2].id, self.users[4].id],
+            transform=lambda user: user.id,
+        )
+        self.assertEqual(caches["default"].get(SYNC_MARK_KEY), 4000)
+
+    def test_falls_back_to_full_sync_without_admin_events(self):
+        caches["default"].set(SYNC_MARK_KEY, 1000)
+        self.events_config = {"adminEventsEnabled": False}
+        self.set_remote_users([user.id for user in self.users])
+
+        call_command("sync_keycloak_users", incremental=True)
+
+        self.admin.get_users.assert_called()
+        self.assertGreater(caches["default"].get(SYNC_MARK_KEY), 1000)
+
+
+class TestIterEvents(TestCase):
+    def test_events_since(self):
+        # 2023-01-02T00:00:01Z
+        since = 1672617601000
+        events = [{"time": since + 2}, {"time": since}, {"time": since - 1}]
+        fetch = mock.Mock(
+            side_effect=lambda query: events[query["first"] : query["first"] + 2]
+        )
+
+        self.assertEqual(
+            list(iter_events(fetch, {"type": ["REGISTER"]}, since, page_size=2)),
+            events[:2],
+        )
+        self.assertEqual(
+            fetch.call_args_list,
+            [
+                mock.call(
+                    {
+                        "type": ["REGISTER"],
+                        "dateFrom": "2023-01-01",
+                        "max": 2,
+                        "first": 0,
+                    }
+                ),
+                mock.call(
+                    {
+                        "type": ["REGISTER"],
+                        "dateFrom": "2023-01-01",
+                        "max": 2,
+                        "first": 2,
+                    }
+                ),
+            ],
+        )
@@ -0,0 +1,356 @@
+import base64
+import threading
+import time
+import uuid
+from unittest import mock
+
+from django.test import SimpleTestCase
+from django_keycloak import token as token_module
+from django_keycloak.cache import credentials_digest, token_digest
+from django_keycloak.claims import ClaimSet
+from django_keycloak.config import settings
+from django_keycloak.jwks import KeyStore
+from django_keycloak.token import (
+    KEYCLOAK,
+    Token,
+    claims_cache,
+    credentials_cache,
+    invalid_tokens_cache,
+    user_info_cache,
+)
+from jose import jwt
+from keycloak.exceptions import KeycloakConnectionError, KeycloakPostError
+
+
+def oct_key(kid: str) -> dict:
+    secret = base64.urlsafe_b64encode(kid.encode() * 32).rstrip(b"=").decode()
+    return {"kty": "oct", "kid": kid, "alg": "HS256", "use": "sig", "k": secret}
+
+
+def sign(kid: str, **claims) -> str:
+    claims = {
+        "sub": str(uuid.uuid4()),
+        "aud": settings.CLIENT_ID,
+        "exp": int(time.time()) + 300,
+        **claims,
+    }
+    return jwt.encode(claims, oct_key(kid), algorithm="HS256", headers={"kid": kid})
+
+
+def returning(value):
+    """
+    Returns a coroutine function returning `value` (`AsyncMock` requires
+    Python 3.8), with a `calls` list of its arguments.
+    """
+
+    async def call(*args, **kwargs):
+        call.calls.append(args)
+        return value
+
+    call.calls = []
+    return call
+
+
+class DecodedTokenTestCase(SimpleTestCase):
+    """
+    Decodes tokens signed with test keys, without contacting Keycloak.
+    """
+
+    def setUp(self):
+        claims_cache.clear()
+        invalid_tokens_cache.clear()
+        user_info_cache.clear()
+        self.key_set = {"keys": [oct_key("a")]}
+        self.fetches = 0
+
+        def fetch():
+            self.fetches += 1
+            return self.key_set
+
+        self.key_store = KeyStore(fetch=fetch, min_refresh_interval=60)
+        for patcher in (
+            mock.patch.object(token_module, "key_store", self.key_store),
+            mock.patch.object(settings, "DECODE_TOKEN", True),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TestInvalidTokensCache(DecodedTokenTestCase):
+    def test_valid_token(self):
+        self.assertTrue(Token(sign("a")).is_active)
+
+    def test_invalid_token_is_remembered(self):
+        token = sign("a", exp=int(time.time()) - 10)
+        with mock.patch.object(Token, "_decode", wraps=Token._decode) as decode:
+            self.assertFalse(Token(token).is_active)
+            self.assertFalse(Token(token).is_active)
+        decode.assert_called_once()
+        self.assertTrue(invalid_tokens_cache.get(token))
+
+    def test_keycloak_errors_are_not_remembered(self):
+        token = sign("a")
+        with mock.patch.object(
+            self.key_store, "get_key", side_effect=KeycloakConnectionError("down")
+        ):
+            self.assertFalse(Token(token).is_active)
+        self.assertIsNone(invalid_tokens_cache.get(token))
+        self.assertTrue(Token(token).is_active)
+
+    def test_key_rotation(self):
+        self.assertTrue(Token(sign("a")).is_active)
+        self.key_set = {"keys": [oct_key("a"), oct_key("b")]}
+        token = sign("b")
+
+        # Within the refresh rate limit the new key is unknown,
+        # which doesn't prove the token is invalid
+        self.assertFalse(Token(token).is_active)
+        self.assertIsNone(invalid_tokens_cache.get(token))
+
+        self.key_store._last_refresh = time.monotonic() - 61
+        self.assertTrue(Token(token).is_active)
+        self.assertEqual(self.fetches, 2)
+
+
+class TestClaimSet(SimpleTestCase):
+    token_info = {
+        "sub": "a",
+        "preferred_username": "user",
+        "email": "user@example.com",
+        "resource_access": {"client": {"roles": ["admin"]}, "other": {"roles": ["x"]}},
+        "realm_access": {"roles": ["user"]},
+        "scope": "openid email",
+        "exp": 10,
+    }
+
+    def test_from_token_info(self):
+        claims = ClaimSet.from_token_info(self.token_info, self.token_info, "client")
+        self.assertEqual(claims.subject, "a")
+        self.assertEqual(claims.username, "user")
+        self.assertEqual(claims.email, "user@example.com")
+        self.assertIsNone(claims.name)
+        self.assertEqual(claims.client_roles, frozenset({"admin"}))
+        self.assertEqual(claims.realm_roles, frozenset({"user"}))
+        self.assertEqual(claims.scopes, frozenset({"openid", "email"}))
+        self.assertEqual(claims.expires_at, 10)
+        self.assertIs(claims.user_info, self.token_info)
+
+    def test_without_user_info(self):
+        claims = ClaimSet.from_token_info({"sub": "a", "scope": "openid"}, None, "c")
+        self.assertIsNone(claims.user_info)
+        self.assertEqual(claims.subject, "a")
+
+        claims = claims.with_user_info({"sub": "a", "preferred_username": "user"})
+        self.assertEqual(claims.username, "user")
+        self.assertEqual(claims.scopes, frozenset({"openid"}))
+
+    def test_slots(self):
+        claims = ClaimSet.from_token_info(self.token_info, None, "client")
+        with self.assertRaises(AttributeError):
+            claims.extra = True
+
+
+@mock.patch.object(settings, "USER_INFO_IN_TOKEN", False)
+class TestTokenClaims(DecodedTokenTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(
+            KEYCLOAK, "userinfo", return_value={"sub": "a", "preferred_username": "u"}
+        )
+        self.userinfo = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_roles_dont_fetch_user_info(self):
+        token = Token(
+            sign(
+                "a",
+                resource_access={settings.CLIENT_ID: {"roles": ["b", "a"]}},
+                realm_access={"roles": ["user"]},
+                scope="openid email",
+            )
+        )
+        self.assertEqual(token.client_roles, ["a", "b"])
+        self.assertEqual(token.realm_roles, ["user"])
+        self.assertEqual(token.client_scopes, ["email", "openid"])
+        self.assertFalse(token.is_superuser)
+        self.userinfo.assert_not_called()
+
+    def test_user_info_is_fetched(self):
+        token = Token(sign("a", sub="a", preferred_username="user"))
+        self.assertEqual(token.claims.username, "u")
+        self.assertEqual(token.user_id, "a")
+        self.assertEqual(Token(token.access_token).claims.username, "u")
+        # From the userinfo cache
+        self.userinfo.assert_called_once_with(token.access_token)
+
+    def test_user_info_in_token(self):
+        token = Token(sign("a", sub="a", preferred_username="user"))
+        with mock.patch.object(settings, "USER_INFO_IN_TOKEN", True):
+            self.assertEqual(token.claims.username, "user")
+            self.assertEqual(token.user_id, "a")
+        self.userinfo.assert_not_called()
+
+    def test_introspected_token_without_user_info(self):
+        token = Token("opaque")
+        self.userinfo.return_value = {
+            "sub": "a",
+            "preferred_username": "user",
+            "given_name": "Ada",
+            "family_name": "Lovelace",
+            "email": "ada@example.com",
+        }
+        with mock.patch.object(settings, "DECODE_TOKEN", False), mock.patch.object(
+            KEYCLOAK,
+            "introspect",
+            return_value={
+                "active": True,
+                "sub": "a",
+                "preferred_username": "user",
+                "exp": int(time.time()) + 300,
+            },
+        ):
+            claims = token.claims
+        self.assertEqual(claims.given_name, "Ada")
+        self.assertEqual(claims.family_name, "Lovelace")
+        self.assertEqual(claims.email, "ada@example.com")
+        self.assertEqual(claims.user_info, token.user_info)
+        self.userinfo.assert_called_once_with("opaque")
+
+    async def test_missing_user_info_is_fetched_async(self):
+        token = Token(sign("a", sub="a"))
+        userinfo = returning({"sub": "a", "preferred_username": "u"})
+        with mock.patch.object(token_module.ASYNC_KEYCLOAK, "userinfo", userinfo):
+            claims = await token.aclaims()
+        self.assertEqual(claims.username, "u")
+        self.assertIs(token.claims, claims)
+        self.assertEqual(userinfo.calls, [(token.access_token,)])
+
+
+@mock.patch.object(settings, "USER_INFO_IN_TOKEN", False)
+class TestUserInfoCache(DecodedTokenTestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(KEYCLOAK, "userinfo", return_value={"sub": "a"})
+        self.userinfo = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_user_info_is_cached(self):
+        token = sign("a")
+        self.assertEqual(Token(token).user_info, {"sub": "a"})
+        self.assertEqual(Token(token).user_info, {"sub": "a"})
+        self.userinfo.assert_called_once_with(token)
+        self.assertEqual(user_info_cache.stats["hits"], 1)
+
+    def test_user_info_expires_with_the_token(self):
+        exp = int(time.time()) + 5
+        token = sign("a", exp=exp)
+        Token(token).user_info
+        expires_at, _ = user_info_cache._cache[token_digest(token)]
+        self.assertEqual(expires_at, exp)
+
+    def test_shared_cache(self):
+        token = sign("a")
+        with mock.patch.object(user_info_cache, "shared_cache", "default"):
+            Token(token).user_info
+            # e.g. another worker
+            user_info_cache._cache.clear()
+            self.assertEqual(Token(token).user_info, {"sub": "a"})
+        self.userinfo.assert_called_once()
+        self.assertEqual(user_info_cache.stats["shared_hits"], 1)
+
+    def test_user_info_in_token(self):
+        token = sign("a", sub="b")
+        with mock.patch.object(settings, "USER_INFO_IN_TOKEN", True):
+            self.assertEqual(Token(token).user_info["sub"], "b")
+        self.userinfo.assert_not_called()
+
+
+class TestCredentialsCache(SimpleTestCase):
+    def setUp(self):
+        credentials_cache.clear()
+        self.grants = 0
+        for patcher in (
+            mock.patch.object(KEYCLOAK, "token", side_effect=self.password_grant),
+            mock.patch.object(KEYCLOAK, "refresh_token", side_effect=self.refresh),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.digest = credentials_digest("user", "password")
+
+    def password_grant(self, username, password):
+        self.grants += 1
+        return self.response(f"access-{self.grants}", expires_in=300)
+
+    def refresh(self, refresh_token):
+        return self.response(f"refreshed-{refresh_token}", expires_in=300)
+
+    @staticmethod
+    def response(access_token, expires_in):
+        return {
+            "access_token": access_token,
+            "refresh_token": f"refresh-{access_token}",
+            "expires_in": expires_in,
+            # Longer than `BASIC_AUTH_CACHE_TTL`
+            "refresh_expires_in": 7200,
+        }
+
+    def cache_expires_at(self):
+        expires_at, _ = credentials_cache._cache[token_digest(self.digest)]
+        return expires_at
+
+    def test_cached_token_is_reused(self):
+        token = Token.from_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "access-1")
+        token = Token.from_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "access-1")
+        self.assertEqual(self.grants, 1)
+
+    def test_expiring_token_is_refreshed(self):
+        Token.from_cached_credentials("user", "password")
+        authenticated_at = credentials_cache.get(self.digest)["authenticated_at"]
+        expires_at = self.cache_expires_at()
+        # Within the refresh leeway
+        credentials_cache.get(self.digest)["expires_at"] = time.time() + 1
+
+        token = Token.from_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "refreshed-refresh-access-1")
+        self.assertEqual(self.grants, 1)
+        # Refreshes don't postpone the next authentication
+        entry = credentials_cache.get(self.digest)
+        self.assertEqual(entry["authenticated_at"], authenticated_at)
+        self.assertEqual(expires_at, authenticated_at + settings.BASIC_AUTH_CACHE_TTL)
+        self.assertEqual(self.cache_expires_at(), expires_at)
+
+    def test_credentials_are_authenticated_again(self):
+        Token.from_cached_credentials("user", "password")
+        # The entry expired `BASIC_AUTH_CACHE_TTL` seconds after authentication
+        credentials_cache.delete(self.digest)
+        token = Token.from_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "access-2")
+        KEYCLOAK.refresh_token.assert_not_called()
+
+    def test_failed_refresh_authenticates_again(self):
+        Token.from_cached_credentials("user", "password")
+        credentials_cache.get(self.digest)["expires_at"] = time.time() + 1
+        KEYCLOAK.refresh_token.side_effect = KeycloakPostError("invalid_grant")
+
+        token = Token.from_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "access-2")
+
+    async def test_digest_is_computed_in_a_thread(self):
+        threads = []
+
+        def digest(username, password):
+            threads.append(threading.get_ident())
+            return credentials_digest(username, password)
+
+        with mock.patch.object(
+            token_module, "credentials_digest", digest
+        ), mock.patch.object(
+            token_module.ASYNC_KEYCLOAK,
+            "token",
+            returning(self.response("access", expires_in=300)),
+        ):
+            token = await Token.afrom_cached_credentials("user", "password")
+        self.assertEqual(token.access_token, "access")
+        self.assertNotEqual(threads, [threading.get_ident()])
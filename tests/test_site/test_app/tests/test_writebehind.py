@@ -0,0 +1,105 @@
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError
+from django.test import TestCase
+from django_keycloak.resolver import user_resolver
+from django_keycloak.writebehind import UserWriteQueue
+
+
+class TestUserWriteQueue(TestCase):
+    def setUp(self):
+        user_resolver.cache.clear()
+        # Only flush explicitly
+        self.queue = UserWriteQueue(batch_size=100, interval=3600)
+        self.addCleanup(self.queue.flush)
+
+    def test_queued_user_is_resolved_before_flush(self):
+        User = get_user_model()
+        user = User(id=uuid.uuid4(), username="bob")
+        self.queue.create(user)
+
+        self.assertFalse(User.objects.filter(id=user.id).exists())
+        with self.assertNumQueries(0):
+            self.assertEqual(user_resolver.get(user.id).username, "bob")
+
+        self.queue.flush()
+        self.assertTrue(User.objects.filter(id=user.id).exists())
+        self.assertEqual(len(self.queue), 0)
+
+    def test_updates_are_merged(self):
+        User = get_user_model()
+        user = User.objects.create(id=uuid.uuid4(), username="bob")
+
+        user.is_staff = True
+        self.queue.update(user, ["is_staff"])
+        user.is_superuser = True
+        self.queue.update(user, ["is_superuser"])
+        self.assertEqual(len(self.queue), 1)
+
+        with self.assertNumQueries(1):
+            self.queue.flush()
+        user.refresh_from_db()
+        self.assertTrue(user.is_staff and user.is_superuser)
+
+    def test_updates_of_queued_users_are_created(self):
+        User = get_user_model()
+        user = User(id=uuid.uuid4(), username="bob")
+        self.queue.create(user)
+        user.is_staff = True
+        self.queue.update(user, ["is_staff"])
+
+        self.queue.flush()
+        self.assertTrue(User.objects.get(id=user.id).is_staff)
+
+    def test_failed_writes_are_queued_again(self):
+        User = get_user_model()
+        user = User(id=uuid.uuid4(), username="bob")
+        self.queue.create(user)
+
+        with mock.patch.object(
+            User.objects, "bulk_upsert", side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError):
+            self.queue.flush()
+        self.assertEqual(len(self.queue), 1)
+
+        self.queue.flush()
+        self.assertTrue(User.objects.filter(id=user.id).exists())
+
+    def test_writes_queued_during_a_failed_flush_are_kept(self):
+        User = get_user_model()
+        user = User.objects.create(id=uuid.uuid4(), username="bob")
+        user.username = "robert"
+        self.queue.update(user, ["username"])
+
+        def update_meanwhile(*args, **kwargs):
+            newer = User.objects.get(id=user.id)
+            newer.is_staff = True
+            self.queue.update(newer, ["is_staff"])
+            raise DatabaseError
+
+        with mock.patch.object(
+            User.objects, "bulk_update", side_effect=update_meanwhile
+        ), self.assertRaises(DatabaseError):
+            self.queue.flush()
+
+        self.queue.flush()
+        user.refresh_from_db()
+        self.assertEqual(user.username, "robert")
+        self.assertTrue(user.is_staff)
+
+    def test_queued_again_up_to_max_size(self):
+        User = get_user_model()
+        queue = UserWriteQueue(batch_size=100, interval=3600, max_size=1)
+        self.addCleanup(queue.flush)
+        queue.create(User(id=uuid.uuid4(), username="bob"))
+        queue.create(User(id=uuid.uuid4(), username="alice"))
+
+        with mock.patch.object(
+            User.objects, "bulk_upsert", side_effect=DatabaseError
+        ), self.assertRaises(DatabaseError), self.assertLogs(
+            "django_keycloak.writebehind", "ERROR"
+        ):
+            queue.flush()
+        self.assertEqual(len(queue), 1)